@@ -1,3 +1,39 @@
 from pathlib import Path
+from typing import Union
 
-BASE_PATH = Path(".")
\ No newline at end of file
+import polars as pl
+
+BASE_PATH = Path(".")
+
+
+def sink_per_location(data: pl.LazyFrame, path: Path, **options) -> None:
+    """
+    Stream the data to a parquet dataset partitioned by location, with the same layout as
+    ``write_parquet(path, partition_by="location")``.
+    :param data: Data with a location column.
+    :param path: Directory of the dataset.
+    :param options: Passed to ``sink_parquet``.
+    """
+    from thesis.model.enums import Location
+
+    # Larger chunks than the default give fewer and larger row groups, which are faster to encode and compress
+    with pl.Config(streaming_chunk_size=100_000):
+        for location in Location:
+            partition_dir = path.joinpath(f"location={location.value}")
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            (data.filter(pl.col("location") == location)
+             .sink_parquet(partition_dir.joinpath("00000000.parquet"), **options))
+
+
+def assert_unique_keys(data: Union[pl.DataFrame, pl.LazyFrame], keys: list[str], name: str) -> None:
+    """
+    Check once that the given key columns uniquely identify each row, so that joins on them do not have to validate
+    the keys every time.
+    :param data: Data to check.
+    :param keys: Columns that should uniquely identify each row.
+    :param name: Name of the data, used in the error message.
+    :raise ValueError: If any key combination appears more than once.
+    """
+    n_duplicated = data.lazy().select(pl.struct(keys).is_duplicated().sum()).collect().item()
+    if n_duplicated > 0:
+        raise ValueError(f"{n_duplicated} rows in {name} have duplicate {keys} values.")
@@ -7,14 +7,18 @@ from thesis.model.enums import Location
 _CROSSING_TIMES_BASE = BASE_PATH.joinpath("data/trajectories/matching/")
 _CROSSING_TIMES_FILE = _CROSSING_TIMES_BASE.joinpath("crossing_times.parquet")
 
-def _open_crossings() -> pl.DataFrame:
-    crossings = pl.read_parquet(_CROSSING_TIMES_FILE)
+def _open_crossings() -> pl.LazyFrame:
+    crossings = pl.scan_parquet(_CROSSING_TIMES_FILE)
     return crossings
 
+def _location_filter(location: Location) -> pl.Expr:
+    # Cast the literal to the column dtype, so that the predicate is pushed down to the parquet reader
+    return pl.col("location") == pl.lit(location, dtype=pl.Enum(Location))
+
 def open_crossing_times_riddarhuskajen() -> pl.DataFrame:
     crossings = _open_crossings()
-    return crossings.filter(pl.col("location") == Location.RIDDARHUSKAJEN)
+    return crossings.filter(_location_filter(Location.RIDDARHUSKAJEN)).collect(engine="streaming")
     
 def open_crossing_times_riddarholmsbron_n() -> pl.DataFrame:
     crossings = _open_crossings()
-    return crossings.filter(pl.col("location") == Location.RIDDARHOLMSBRON_N)
\ No newline at end of file
+    return crossings.filter(_location_filter(Location.RIDDARHOLMSBRON_N)).collect(engine="streaming")
@@ -1,19 +1,26 @@
+from typing import Optional
+
 import polars as pl
 
 from thesis.files import BASE_PATH
 
 SUMMARY_FILE = BASE_PATH.joinpath("data/trajectories/summary.parquet")
 
-def add_summary_information(trajectories: pl.LazyFrame, with_overall_columns = False) -> pl.LazyFrame:
+def add_summary_information(trajectories: pl.LazyFrame, with_overall_columns = False,
+                            columns: Optional[list[str]] = None) -> pl.LazyFrame:
     """
     Add pre-calculated information about each trajectory.
     :param trajectories: 
     :param with_overall_columns: Some columns, such as speed, acceleration and theta, appear on both the file with
     the trajectories and in the summary file.
     If set to False, those columns are removed from the returned DataFrame.
+    :param columns: If given, only these summary columns are added, so that the rest are not read at all.
     """
+    join_cols = ["location", "ID", "direction"]
     summary = pl.scan_parquet(SUMMARY_FILE)
-    if not with_overall_columns:
+    if columns is not None:
+        summary = summary.select(join_cols + [c for c in columns if c not in join_cols])
+    elif not with_overall_columns:
         duplicate_cols = ["theta", "type"]
         summary = summary.drop(duplicate_cols)
-    return trajectories.join(summary, on=["location", "ID", "direction"], how="left", validate="m:1")
\ No newline at end of file
+    return trajectories.join(summary, on=join_cols, how="left")
\ No newline at end of file
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Optional
+
 import polars as pl
 
 from thesis.files import BASE_PATH
@@ -6,13 +9,22 @@ _MATCHING_BASE_DIR = BASE_PATH.joinpath("data/trajectories/matching/")
 _MATCHES_FILE = _MATCHING_BASE_DIR.joinpath("matches.parquet")
 
 
+@lru_cache(maxsize=1)
 def open_all_matches() -> pl.LazyFrame:
     matches = pl.scan_parquet(_MATCHES_FILE)
     return matches
 
 
-def add_matches(trajectories: pl.LazyFrame) -> pl.LazyFrame:
+def add_matches(trajectories: pl.LazyFrame, columns: Optional[list[str]] = None) -> pl.LazyFrame:
+    """
+    Add the observation information matched to each trajectory.
+    :param trajectories: 
+    :param columns: If given, only these columns of the matches are added, so that the rest are not read at all.
+    """
+    join_cols = ["location", "ID", "direction"]
     matches = open_all_matches()
+    if columns is not None:
+        matches = matches.select(join_cols + [c for c in columns if c not in join_cols])
     trajectories = trajectories.join(matches.filter(pl.col("ID").is_not_null()),
-                                     on=["location", "ID", "direction"], how="left", validate="m:1")
+                                     on=join_cols, how="left")
     return trajectories
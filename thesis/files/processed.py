@@ -1,67 +1,121 @@
+import shutil
+from functools import lru_cache, reduce
+from pathlib import Path
+from typing import Union
+
 import polars as pl
 from thesis.files.trajectories import open_trajectories
-from thesis.files import BASE_PATH
+from thesis.files import BASE_PATH, assert_unique_keys
 
-results_per_datapoint_file = BASE_PATH.joinpath("data/trajectories/results_datapoint.parquet")
-results_per_id_file = BASE_PATH.joinpath("data/trajectories/results_id.parquet")
+# Each results directory contains an index file with the keys of every row and one file for each result column
+results_per_datapoint_dir = BASE_PATH.joinpath("data/trajectories/results_datapoint")
+results_per_id_dir = BASE_PATH.joinpath("data/trajectories/results_id")
+_INDEX_FILE_NAME = "index.parquet"
+# Small row groups with full statistics, so that queries for a single location or ID can skip most of them
+_WRITE_OPTIONS = dict(partition_by="location", row_group_size=128_000, statistics="full", compression="zstd",
+                      compression_level=3)
 
 
 def create_results_per_datapoint() -> None:
-    trajectories = open_trajectories().select(["location", "time", "ID"])
-    trajectories.write_parquet(results_per_datapoint_file)
+    trajectories = open_trajectories().select(["location", "time", "ID"]).collect()
+    _create_results(trajectories, results_per_datapoint_dir)
 
 
 def create_results_per_id_file() -> None:
-    trajectories = open_trajectories().select(["location", "ID"]).unique()
-    trajectories.write_parquet(results_per_id_file)
+    trajectories = open_trajectories().select(["location", "ID"]).unique().collect()
+    _create_results(trajectories, results_per_id_dir)
+
 
+def _remove_results(file: Path) -> None:
+    if file.is_dir():
+        shutil.rmtree(file)
+    elif file.exists():
+        file.unlink()
 
-def save_results_per_id(new_results: pl.DataFrame, replace=False) -> None:
+
+def _create_results(index: pl.DataFrame, results_dir: Path) -> None:
     """
-    Add a new column to the results per ID file.
-    :param new_results: DataFrame containing the ``ID`` and ``location`` columns (to uniquely identify each
-    trajectory) and one more column that will be added.
-    :param replace: Whether to replace the new column if it already exists. 
+    Remove any previous results and write the index of the results in the given directory.
+    """
+    _remove_results(results_dir)
+    results_dir.mkdir(parents=True)
+    index.write_parquet(results_dir.joinpath(_INDEX_FILE_NAME), **_WRITE_OPTIONS)
+    _clear_open_results_cache()
+
+
+def _extract_new_col(columns: list[str], idx_cols: set[str]) -> str:
+    """
+    :return: The name of the single column in ``columns`` that is not an index column.
+    :raise ValueError: If the columns are not the index columns and exactly one more column.
     """
-    columns = set(new_results.columns)
-    idx_cols = {'ID', 'location'}
-    new_col = columns - idx_cols
-    if len(columns) != 3 or len(new_col) != 1:
-        raise ValueError("The results dataframe must have the ID and location columns and one more column.")
-    new_col = new_col.pop()
+    new_col = set(columns) - idx_cols
+    if len(columns) != len(idx_cols) + 1 or len(new_col) != 1:
+        idx_names = sorted(idx_cols)
+        raise ValueError(f"The results dataframe must have the {', '.join(idx_names[:-1])} and {idx_names[-1]} "
+                         f"columns and one more column.")
+    return new_col.pop()
 
-    results = open_results_per_id().collect()
-    if new_col in results.columns and not replace:
+
+def _save_result_column(new_results: pl.LazyFrame, idx_cols: set[str], new_col: str, results_dir: Path,
+                        replace: bool) -> None:
+    """
+    Write the new result column to its own file, next to the index and the other results.
+    Only the new column is written, the existing results are not read or rewritten.
+    """
+    column_file = results_dir.joinpath(f"{new_col}.parquet")
+    if column_file.exists() and not replace:
         print(f"Column {new_col} already exists. If you want to overwrite it, set replace to True")
         return
-    elif new_col in results.columns:
-        results = results.drop(new_col)
-    results = results.join(new_results, how="left", on=idx_cols, validate="1:1")
-    results.write_parquet(results_per_id_file)
+    # Only the index and the new column are materialized, which is much less than the whole results table
+    new_results = new_results.collect(engine="streaming")
+    # Validate the keys once here, so that joins with the results do not have to
+    assert_unique_keys(new_results, list(idx_cols), new_col)
+    _remove_results(column_file)
+    new_results.write_parquet(column_file, **_WRITE_OPTIONS)
+    _clear_open_results_cache()
 
 
-def save_results_per_datapoint(new_results: pl.DataFrame, replace=False) -> None:
+def _open_results(results_dir: Path, idx_cols: list[str]) -> pl.LazyFrame:
+    """
+    Join the index with every result column file in the given directory.
+    """
+    index = pl.scan_parquet(results_dir.joinpath(_INDEX_FILE_NAME), hive_partitioning=True)
+    column_files = sorted(f for f in results_dir.glob("*.parquet") if f.name != _INDEX_FILE_NAME)
+    column_results = [pl.scan_parquet(f, hive_partitioning=True) for f in column_files]
+    return reduce(lambda results, column: results.join(column, on=idx_cols, how="left"),
+                  column_results, index)
+
+
+def _clear_open_results_cache() -> None:
+    """
+    The opened results are cached, so they must be reopened after the files have changed.
+    """
+    open_results_per_datapoint.cache_clear()
+    open_results_per_id.cache_clear()
+
+
+def save_results_per_id(new_results: Union[pl.LazyFrame, pl.DataFrame], replace=False) -> None:
+    """
+    Add a new column to the results per ID file.
+    :param new_results: DataFrame containing the ``ID`` and ``location`` columns (to uniquely identify each
+    trajectory) and one more column that will be added. Can be lazy.
+    :param replace: Whether to replace the new column if it already exists. 
+    """
+    new_results = new_results.lazy()
+    new_col = _extract_new_col(new_results.collect_schema().names(), {'ID', 'location'})
+    _save_result_column(new_results, {'ID', 'location'}, new_col, results_per_id_dir, replace)
+
+
+def save_results_per_datapoint(new_results: Union[pl.LazyFrame, pl.DataFrame], replace=False) -> None:
     """
     Add a new column to the results per datapoint file.
     :param new_results: DataFrame containing the ``ID``, ``time``, and ``location`` columns (to uniquely identify each
-    datapoint) and one more column that will be added.
+    datapoint) and one more column that will be added. Can be lazy.
     :param replace: Whether to replace the new column if it already exists. 
     """
-    columns = set(new_results.columns)
-    idx_cols = {'ID', 'time', 'location'}
-    new_col = columns - idx_cols
-    if len(columns) != 4 or len(new_col) != 1:
-        raise ValueError("The results dataframe must have the ID, time and location columns and one more column.")
-    new_col = new_col.pop()
-
-    results = open_results_per_datapoint().collect()
-    if new_col in results.columns and not replace:
-        print(f"Column {new_col} already exists. If you want to overwrite it, set replace to True")
-        return
-    elif new_col in results.columns:
-        results = results.drop(new_col)
-    results = results.join(new_results, how="left", on=idx_cols, validate="1:1")
-    results.write_parquet(results_per_datapoint_file)
+    new_results = new_results.lazy()
+    new_col = _extract_new_col(new_results.collect_schema().names(), {'ID', 'time', 'location'})
+    _save_result_column(new_results, {'ID', 'time', 'location'}, new_col, results_per_datapoint_dir, replace)
 
 
 def add_results_per_datapoint(trajectories: pl.LazyFrame) -> pl.LazyFrame:
@@ -75,18 +129,20 @@ def add_results_per_id(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     return trajectories
 
 
+@lru_cache(maxsize=1)
 def open_results_per_datapoint() -> pl.LazyFrame:
     """
     Open the file containing additional columns for each datapoint.
     Each datapoint is uniquely defined by the ``location``, ``time`` and ``ID`` combination.
     :return: Lazy
     """
-    return pl.scan_parquet(results_per_datapoint_file)
+    return _open_results(results_per_datapoint_dir, ["location", "time", "ID"])
 
 
+@lru_cache(maxsize=1)
 def open_results_per_id() -> pl.LazyFrame:
     """
     Open the file containing additional columns for each trajectory ``location``, ``ID``
     :return: 
     """
-    return pl.scan_parquet(results_per_id_file)
+    return _open_results(results_per_id_dir, ["location", "ID"])
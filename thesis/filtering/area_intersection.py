@@ -1,23 +1,25 @@
+import numpy as np
 import polars as pl
 
-from numba import guvectorize, float64, bool
 
-
-@guvectorize([(float64, float64, float64[:], float64[:], float64[:], float64[:], bool[:])],
-             "(),(),(n),(n),(n),(n)->()")
-def coords_intersect_polygon(x, y, p1, p2, p3, p4, res) -> bool:
+def coords_intersect_polygon(x, y, p1, p2, p3, p4) -> np.ndarray:
     """
-    Checks whether the point given by x,y is inside (or in the edges) of the shape denoted by the
+    Checks whether the points given by x,y are inside (or in the edges) of the shape denoted by the
     given points.
     The points must be given in counter-clockwise order.
+    :param x: X coordinate or array of X coordinates of the points.
+    :param y: Y coordinate or array of Y coordinates of the points.
+    :return: Boolean array, with the same shape as x and y.
     """
     # https://stackoverflow.com/questions/2752725/finding-whether-a-point-lies-inside-a-rectangle-or-not
+    # Keep the dtype of the given arrays, so float32 coordinates are not copied
+    x = np.asarray(x)
+    y = np.asarray(y)
     d1 = (p2[0] - p1[0]) * (y - p1[1]) - (x - p1[0]) * (p2[1] - p1[1])
     d2 = (p3[0] - p2[0]) * (y - p2[1]) - (x - p2[0]) * (p3[1] - p2[1])
     d3 = (p4[0] - p3[0]) * (y - p3[1]) - (x - p3[0]) * (p4[1] - p3[1])
     d4 = (p1[0] - p4[0]) * (y - p4[1]) - (x - p4[0]) * (p1[1] - p4[1])
-    inside = d1 >= 0 and d2 >= 0 and d3 >= 0 and d4 >= 0
-    res[0] = inside
+    return (d1 >= 0) & (d2 >= 0) & (d3 >= 0) & (d4 >= 0)
 
 
 def points_are_counterclockwise(points: list[tuple[float, float]]) -> bool:
@@ -42,9 +42,9 @@ def _do_filter(trajectories: pl.LazyFrame, summary: pl.LazyFrame, filters: Itera
     :return: Dataframe containing trajectory data matching the given filters.
     """
     # Keep original columns so we can return only them
-    original_columns = trajectories.columns
+    original_columns = trajectories.collect_schema().names()
     
-    common_columns = set(original_columns).intersection(summary.columns)
+    common_columns = set(original_columns).intersection(summary.collect_schema().names())
     if len(common_columns) > 0:
         print(f"Warning: columns {common_columns} appear in both trajectories and summary. This can cause problems"
               f"during filtering.")
@@ -57,7 +57,7 @@ def _do_filter(trajectories: pl.LazyFrame, summary: pl.LazyFrame, filters: Itera
     return trajectories
 
 def apply_filters(trajectories: pl.DataFrame, filters: Iterable[Filter]) -> pl.DataFrame:
-    summary = pl.scan_csv(SUMMARY_FILE)
+    summary = pl.scan_parquet(SUMMARY_FILE)
     trajectories = _do_filter(trajectories.lazy(), summary, filters)
     
     return trajectories
\ No newline at end of file
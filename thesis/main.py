@@ -1,7 +1,10 @@
+import polars as pl
+
 from thesis.files.filtering import add_summary_information
 from thesis.files.observation_matching import add_matches
 from thesis.files.processed import add_results_per_datapoint, add_results_per_id
 from thesis.files.trajectories import open_trajectories
+from thesis.model.enums import Location
 from thesis.preprocessing import preprocess
 from thesis.processing import save_all_results
 from thesis.processing.interactions import add_constrained_type
@@ -13,17 +16,24 @@ def main():
     save_all_results()
     
     # Add all the calculated information to the trajectories
-    trajectories = open_trajectories().lazy()
+    trajectories = open_trajectories()
     trajectories = add_matches(trajectories)
     trajectories = add_summary_information(trajectories)
     trajectories = add_results_per_datapoint(trajectories)
     trajectories = add_results_per_id(trajectories)
     trajectories = add_constrained_type(trajectories)
     
-    # Save the graphs
-    riddarhuskajen(trajectories)
-    riddarholmsbron_n(trajectories)
-    riddarholmsbron_s(trajectories)
+    # Every graph collects the trajectories again, so run the joins once for all locations and share the scan
+    rk, rb_n, rb_s = pl.collect_all([
+        trajectories.filter(pl.col("location") == location) for location in
+        (Location.RIDDARHUSKAJEN, Location.RIDDARHOLMSBRON_N, Location.RIDDARHOLMSBRON_S)
+    ])
+
+    # Save the graphs. Each function gets only the trajectories of its location.
+    riddarhuskajen(rk.lazy())
+    riddarholmsbron_n(rb_n.lazy())
+    # Riddarholmsbron S also compares meetings with Riddarholmsbron N
+    riddarholmsbron_s(rb_s.lazy(), rb_n.lazy())
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
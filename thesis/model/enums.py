@@ -13,6 +13,8 @@ Primary_Type_Literal = Literal["Regular", "Electric", "Cargo", "Folding", "Moped
 
 Secondary_Type = pl.Enum(["Pedal", "Electric", "Women's bicycle"])
 
+Constrained_Type = pl.Enum(["Overtakes", "Both, does not overtake", "Only meeting", "Only following", "Unconstrained"])
+
 class Location(str, Enum):
     RIDDARHUSKAJEN = "Riddarhuskajen"
     RIDDARHOLMSBRON_N = "Riddarholmsbron_n"
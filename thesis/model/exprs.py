@@ -10,30 +10,50 @@ def is_off_peak(time_col_name: str) -> pl.Expr:
     )
     return expr
 
+_TIME_OF_DAY = pl.Enum(["am", "pm", "between_peaks", "other"])
+
+
+def _observation_periods() -> pl.DataFrame:
+    """
+    :return: DataFrame with the start, end and time of day of every observation period, sorted by start.
+    """
+    periods = []
+    for day in observation_periods_all():
+        periods.append((*am_peak(day), "am"))
+        periods.append((*off_peak(day), "between_peaks"))
+        periods.append((*pm_peak(day), "pm"))
+    periods = pl.DataFrame(periods, schema={"start": pl.Datetime(time_zone="Europe/Stockholm"),
+                                            "end": pl.Datetime(time_zone="Europe/Stockholm"),
+                                            "time_of_day": _TIME_OF_DAY}, orient="row")
+    return periods.sort("start")
+
+
+_PERIODS = _observation_periods()
+
+
+def _period_index(time_col_name: str) -> pl.Expr:
+    """
+    Index of the last period in ``_PERIODS`` that starts before the given time, or -1 if there is none.
+    The periods do not overlap, so this is the only period that can contain the time.
+    """
+    return pl.lit(_PERIODS["start"]).search_sorted(pl.col(time_col_name), side="right").cast(pl.Int64) - 1
+
+
+def _in_period(time_col_name: str, period_index: pl.Expr) -> pl.Expr:
+    period_end = pl.lit(_PERIODS["end"]).gather(period_index.clip(lower_bound=0))
+    return (period_index >= 0) & (pl.col(time_col_name) <= period_end)
+
+
 def is_observed(time_col_name: str) -> pl.Expr:
-    observed_periods = observation_periods_all()
-    expr = None
-    for day, periods in observed_periods.items():
-        for period in periods:
-            if expr is None:
-                expr = ((pl.col(time_col_name).dt.day() == day) & (pl.col(time_col_name).is_between(*period)))
-            else:
-                expr = expr | ((pl.col(time_col_name).dt.day() == day) & (pl.col(time_col_name).is_between(*period)))
-    return expr
+    # Look up the period of each time with a binary search over the sorted periods, instead of comparing against
+    # every period.
+    period_index = _period_index(time_col_name)
+    return _in_period(time_col_name, period_index)
 
 
 def time_of_day_column(time_col_name: str) -> pl.Expr:
-    am_periods = [am_peak(x) for x in range(1,4)]
-    is_am = pl.any_horizontal(*[pl.col(time_col_name).is_between(start,end) for (start,end) in am_periods])
-    pm_periods = [pm_peak(x) for x in range(1,4)]
-    is_pm = pl.any_horizontal(*[pl.col(time_col_name).is_between(start,end) for (start,end) in pm_periods])
-    op_periods = [off_peak(x) for x in range(1,4)]
-    is_op = pl.any_horizontal(*[pl.col(time_col_name).is_between(start,end) for (start,end) in op_periods])
-    time_of_day_enum = pl.Enum(["am", "pm", "between_peaks", "other"])
-    return pl.when(is_am).then(pl.lit("am", dtype=time_of_day_enum)).when(
-        is_pm
-    ).then(
-        pl.lit("pm", dtype=time_of_day_enum)
-    ).when(is_op).then(pl.lit("between_peaks", dtype=time_of_day_enum)).otherwise(
-        pl.lit("other", dtype=time_of_day_enum)
+    period_index = _period_index(time_col_name)
+    time_of_day = pl.lit(_PERIODS["time_of_day"]).gather(period_index.clip(lower_bound=0))
+    return pl.when(_in_period(time_col_name, period_index)).then(time_of_day).otherwise(
+        pl.lit("other", dtype=_TIME_OF_DAY)
     ).alias("time_of_day")
@@ -1,9 +1,14 @@
+import polars as pl
+
+from thesis.files import assert_unique_keys
 from thesis.preprocessing.summary import preprocess_summary
 from thesis.preprocessing.trajectories import preprocess_trajectories
 from thesis.preprocessing.observations import preprocess_observations
 
 
 def preprocess():
+    from thesis.files.filtering import SUMMARY_FILE
     preprocess_trajectories()
     preprocess_summary()
+    assert_unique_keys(pl.scan_parquet(SUMMARY_FILE), ["location", "ID", "direction"], "summary")
     preprocess_observations()
@@ -1,16 +1,12 @@
-import subprocess
+import io
 
 import polars as pl
 
-from zoneinfo import ZoneInfo
-from datetime import datetime, timedelta
-
 from thesis.files import BASE_PATH
 from thesis.files.observations import OBSERVATIONS_PROCESSED_FILE_PATH
 from thesis.model.enums import Direction, Primary_Type, Secondary_Type, Relative_Position
 
 OBSERVATIONS_ORIGINAL_FILE_PATH = BASE_PATH.joinpath("data/observations/observations.txt")
-OBSERVATIONS_CLEANED_FILE_PATH = BASE_PATH.joinpath("data/observations/observations-clean.txt")
 
 
 def preprocess_observations():
@@ -18,127 +14,91 @@ def preprocess_observations():
     Processes the files given by the observer.
     :return: 
     """
-
-    # We need to convert the file of the observer from UTF-16 to UTF-8
-    if OBSERVATIONS_CLEANED_FILE_PATH.exists():
-        print("Observations file with correct encoding already exists. Not overwriting.")
-    else:
-        subprocess.run(["iconv", "-f", "UTF-16LE", "-t", "UTF8", "-o", str(OBSERVATIONS_CLEANED_FILE_PATH),
-                        str(OBSERVATIONS_ORIGINAL_FILE_PATH)])
-    
     OBSERVATIONS_PROCESSED_FILE_PATH.parent.mkdir(exist_ok=True)
     observations = open_original_observations()
     observations.write_parquet(OBSERVATIONS_PROCESSED_FILE_PATH)
 
-def _get_video_start_time(day: int, period: str) -> datetime:
-    tz = ZoneInfo("Europe/Stockholm")
-    if period == "PM":
-        return datetime(2024, 10, day, 16, 0, tzinfo=tz)
-    elif period == "AM":
-        if day == 1:
-            return datetime(2024, 10, 1, 6, 45, tzinfo=tz)
-        elif day == 2:
-            return datetime(2024, 10, 2, 6, 46, tzinfo=tz)
-        elif day == 3:
-            return datetime(2024, 10, 3, 6, 46, tzinfo=tz)
-    elif period == "OP":
-        if day == 1:
-            return datetime(2024, 10, 1, 11, 00, tzinfo=tz)
-        else:
-            return datetime(2024, 10, day, 12, 00, tzinfo=tz)
-    raise ValueError(f"Unknown period {period}")
-
-
-def _get_observation_start_time(day: str, period: str, start_time: str) -> datetime:
+def _get_period_start_times() -> pl.Expr:
+    """
+    Returns an expression with the start time of the period when the observation was made.
+    The period is given by the Observation name (from Observer), which contains the day, the period and the start time
+    of the video.
+    :return: Expression containing the period start time of the corresponding observation.
+    """
+    period_info = (pl.col("Observation").str.extract_groups(r"(0[1-3])/10 ([PA]M|OP) .+ ([0-9]+).*")
+                   .struct.rename_fields(["day", "period", "start_time"]))
+    day = period_info.struct.field("day").cast(pl.Int32)
+    period = period_info.struct.field("period")
+    start_time = period_info.struct.field("start_time").cast(pl.Int32)
+
     # Get the start datetime of the video
-    start_datetime = _get_video_start_time(int(day), period)
+    video_start_time = (pl.when(period == "PM").then(pl.datetime(2024, 10, day, 16, 0, time_unit="ms"))
+                        .when(period == "AM", day == 1).then(pl.datetime(2024, 10, 1, 6, 45, time_unit="ms"))
+                        .when(period == "AM").then(pl.datetime(2024, 10, day, 6, 46, time_unit="ms"))
+                        .when(period == "OP", day == 1).then(pl.datetime(2024, 10, 1, 11, 0, time_unit="ms"))
+                        .when(period == "OP").then(pl.datetime(2024, 10, day, 12, 0, time_unit="ms"))
+                        .dt.replace_time_zone("Europe/Stockholm"))
     # If the video is part two, we need to add the time of part 1
-    _part_1_length = timedelta(hours=1, minutes=32, seconds=2, milliseconds=520)
-    if int(start_time) in (8, 17):
-        start_datetime += _part_1_length
-    return start_datetime
+    part_1_length = pl.duration(hours=1, minutes=32, seconds=2, milliseconds=520, time_unit="ms")
+    return (pl.when(start_time.is_in([8, 17])).then(video_start_time + part_1_length)
+            .otherwise(video_start_time))
 
 
-def _get_period_start_times(observations: pl.DataFrame) -> pl.Series:
-    """
-    Returns a series with the start time of the period when the observation was made.
-    :param observations: 
-    :return: Series containing a ```datetime``` object for the period start time of the corresponding observation.
-    """
-    # Create a dictionary mapping each Observation name (from Observer) to a start datetime
-    # Get all unique Observation values
-    # available_periods = observations.select(pl.col("Observation").unique())
-    available_periods = observations.select(pl.col("Observation").unique().alias("original_name")).with_columns(
-        period_info=pl.col("original_name").
-        str.
-        extract_groups(r"(0[1-3])/10 ([PA]M|OP) .+ ([0-9]+).*").
-        struct.rename_fields(["day", "period", "start_time"]))
-    # Extract the necessary information for each period
-    # Convert the dataframe to a 1-column dataframe with a struct containing
-    # original_name (from observer), day, period, start_time for each unique observation value
-    available_periods = available_periods.unnest("period_info").to_struct()
-    # Create a mapping for Observation to a start_datetime
-    start_time_mapping = {s["original_name"]: _get_observation_start_time(s["day"], s["period"], s["start_time"]) for s
-                          in available_periods}
-    # Get the start time for each observation
-    start_times = observations.select(pl.col("Observation").replace_strict(start_time_mapping)).to_series()
-    return start_times
-
-
-def _get_deltas(observations: pl.DataFrame) -> pl.Series:
+def _get_deltas() -> pl.Expr:
     """
     Calculate the time relative to the start time of the period.
-    :param observations: 
-    :return: Series with ```timedelta``` objects.
+    :return: Duration expression.
     """
-    # Parse columns containing time values
-    deltas = observations.select(pl.col("Time_Relative_hmsf").str.strptime(pl.Time, "%H:%M:%S%.f"))
-    deltas = deltas.with_columns(pl.col("Time_Relative_hmsf").map_elements(
-        lambda x: timedelta(hours=x.hour, minutes=x.minute, seconds=x.second, milliseconds=x.microsecond // 1000),
-        return_dtype=timedelta)).to_series()
+    # Parsed as a time value by the CSV reader
+    relative_time = pl.col("Time_Relative_hmsf")
+    deltas = pl.duration(hours=relative_time.dt.hour(), minutes=relative_time.dt.minute(),
+                         seconds=relative_time.dt.second(), milliseconds=relative_time.dt.millisecond(),
+                         time_unit="ms")
     return deltas
 
 
-def _add_absolute_dates(observations: pl.DataFrame) -> pl.DataFrame:
+def _add_absolute_dates(observations: pl.LazyFrame) -> pl.LazyFrame:
     """
     Add the ```abs_time``` column, containing the absolute time of the observation.
     :param observations: 
     :return: Dataframe with ```abs_time``` column, containing ```datetime``` objects..
     """
-    start_times = _get_period_start_times(observations)
-    deltas = _get_deltas(observations)
     # Integrate the start times with the delta
-    observations = observations.with_columns(abs_time=(start_times + deltas))
+    observations = observations.with_columns(abs_time=(_get_period_start_times() + _get_deltas()))
     return observations
 
 
-def _add_direction(observations: pl.DataFrame) -> pl.DataFrame:
+def _add_direction(observations: pl.LazyFrame) -> pl.LazyFrame:
     """
     Adds a ```direction``` column with values from :py:class:`model.enums.Direction_Enum`.
     
     For off-peak observations, the ```Comments``` column is used. It should be a list, containing "N" or "S" depending
-    on the direction of the observation.
+    on the direction of the observation. These are removed from the comments in :py:func:`_parse_comments`.
     :param observations: 
     :return: Dataframe including ```direction``` column.
     """
+    # Search each string only once and reuse the results in the conditions
+    observations = observations.with_columns(
+        _has_nb=pl.col("Observation").str.contains("NB", literal=True),
+        _has_sb=pl.col("Observation").str.contains("SB", literal=True),
+        _has_bd=pl.col("Observation").str.contains("BD", literal=True),
+        _comment_n=pl.col("Comment").list.contains("N"),
+        _comment_s=pl.col("Comment").list.contains("S")
+    )
     observations = observations.with_columns(direction=pl.
-                                             when(pl.col("Observation").str.contains("NB")).
+                                             when(pl.col("_has_nb")).
                                              then(pl.lit("Northbound")).
-                                             when(pl.col("Observation").str.contains("SB")).
+                                             when(pl.col("_has_sb")).
                                              then(pl.lit("Southbound")).
-                                             when(pl.col("Observation").str.contains("BD"),
-                                                  pl.col("Comment").list.contains("N")).
+                                             when(pl.col("_has_bd"), pl.col("_comment_n")).
                                              then(pl.lit("Northbound")).
-                                             when(pl.col("Observation").str.contains("BD"),
-                                                  pl.col("Comment").list.contains("S")).
+                                             when(pl.col("_has_bd"), pl.col("_comment_s")).
                                              then(pl.lit("Southbound")).
                                              cast(Direction))
-    # Remove N and S from the comment column
-    observations = observations.with_columns(pl.col("Comment").list.set_difference(["N", "S"]))
-    return observations
+    return observations.drop(["_has_nb", "_has_sb", "_has_bd", "_comment_n", "_comment_s"])
 
 
-def _parse_bike_types(observations: pl.DataFrame) -> pl.DataFrame:
+def _parse_bike_types(observations: pl.LazyFrame) -> pl.LazyFrame:
     """
     Converts the ``Subject`` and ``Behavior`` columns into primary and secondary type columns.
     Drops any rows without a Subject defined.
@@ -148,65 +108,34 @@ def _parse_bike_types(observations: pl.DataFrame) -> pl.DataFrame:
     # Drop observations with no Subject as errors
     observations = observations.filter(pl.col("Subject").str.len_chars() > 0)
     # Primary type is always specified, secondary type is optional
-    observations = observations.with_columns(pl.col("Subject").cast(Primary_Type))
-    observations = observations.with_columns(pl.col("Behavior").cast(Secondary_Type, strict=False))
-    observations = observations.rename({
-        "Subject": "primary_type",
-        "Behavior": "secondary_type"
-    })
-    return observations
-
-
-def _parse_rental(observations: pl.DataFrame) -> pl.DataFrame:
-    # Scooters are rental by default, electric are rental if specified, otherwise false
-    predicate = (pl
-                 .when(pl.col("primary_type") == "Electric",
-                       pl.col("Comment").list.contains("Rental"))
-                 .then(True)
-                 .when(pl.col("primary_type") == "Scooter",
-                       ~pl.col("Comment").list.contains("Private"))
-                 .then(True)
-                 .otherwise(False))
-    # observations = observations.with_columns(rental=pl.lit(False))
-    observations = observations.with_columns(rental=predicate)
-    # Remove the relevant values from comments
-    observations = observations.with_columns(pl.col("Comment").list.set_difference(["Rental", "Private"]))
-    return observations
-
-
-def _parse_uncertain(observations: pl.DataFrame) -> pl.DataFrame:
-    observations = observations.with_columns(pl.col("Comment").list.contains("U").alias("uncertain"))
-    observations = observations.with_columns(pl.col("Comment").list.set_difference(["U"]))
+    observations = observations.with_columns(
+        primary_type=pl.col("Subject").cast(Primary_Type),
+        secondary_type=pl.col("Behavior").cast(Secondary_Type, strict=False)
+    ).drop(["Subject", "Behavior"])
     return observations
 
 
-def _parse_position(observations: pl.DataFrame) -> pl.DataFrame:
-    predicate = ((pl.when(pl.col("Comment").list.contains("Front")).then(pl.lit("Front"))
-                  .when(pl.col("Comment").list.contains("Back")).then(pl.lit("Back")))
-                 .otherwise(None).cast(Relative_Position, strict=False))
-    observations = observations.with_columns(relative_position=predicate)
-    # Remove relative comments
-    observations = observations.with_columns(pl.col("Comment").list.set_difference(["Front", "Back"]))
-    return observations
+# Comment values that are parsed into their own columns
+_PARSED_COMMENTS = ["N", "S", "Rental", "Private", "U", "Front", "Back", "Carrying", "bag", "bags", "tyres"]
 
 
-def _parse_carrying(observations: pl.DataFrame) -> pl.DataFrame:
-    predicate = pl.when(pl.col("Comment").list.contains("Carrying")).then(pl.lit(True)).otherwise(False)
-    observations = observations.with_columns(carrying_something=predicate)
-    # Remove relative comments
+def _parse_comments(observations: pl.LazyFrame) -> pl.LazyFrame:
+    comment = pl.col("Comment")
+    # Parse comments that we can, probing the list column in a single pass
     observations = observations.with_columns(
-        pl.col("Comment").list.set_difference(["Carrying", "bag", "bags", "tyres"]))
-    return observations
-
-
-def _parse_comments(observations: pl.DataFrame) -> pl.DataFrame:
-    # Parse comments that we can
-    observations = _parse_rental(observations)
-    observations = _parse_uncertain(observations)
-    observations = _parse_position(observations)
-    observations = _parse_carrying(observations)
-    # Store the remaining comments in another column
-    observations = observations.with_columns(comments=pl.col("Comment").list.join(" ")).drop("Comment")
+        # Scooters are rental by default, electric are rental if specified, otherwise false
+        rental=(pl.when(pl.col("primary_type") == "Electric", comment.list.contains("Rental")).then(True)
+                .when(pl.col("primary_type") == "Scooter", ~comment.list.contains("Private")).then(True)
+                .otherwise(False)),
+        uncertain=comment.list.contains("U"),
+        relative_position=(pl.when(comment.list.contains("Front")).then(pl.lit("Front"))
+                           .when(comment.list.contains("Back")).then(pl.lit("Back"))
+                           .otherwise(None).cast(Relative_Position, strict=False)),
+        carrying_something=pl.when(comment.list.contains("Carrying")).then(pl.lit(True)).otherwise(False)
+    )
+    # Remove all the parsed values at once and store the remaining comments in another column
+    observations = observations.with_columns(
+        comments=pl.col("Comment").list.set_difference(_PARSED_COMMENTS).list.join(" ")).drop("Comment")
     return observations
 
 
@@ -219,7 +148,9 @@ def open_original_observations() -> pl.DataFrame:
     * Parses comments
     :return: 
     """
-    observations = pl.read_csv(OBSERVATIONS_CLEANED_FILE_PATH, separator=';')
+    # The file of the observer is UTF-16, convert it to UTF-8 in memory
+    contents = io.BytesIO(OBSERVATIONS_ORIGINAL_FILE_PATH.read_bytes().decode("utf-16-le").encode("utf-8"))
+    observations = pl.scan_csv(contents, separator=';', schema_overrides={"Time_Relative_hmsf": pl.Time})
     # Split comments
     observations = observations.with_columns(pl.col("Comment").str.split(" "))
     observations = _parse_bike_types(observations)
@@ -230,4 +161,6 @@ def open_original_observations() -> pl.DataFrame:
     observations = observations.select(["abs_time", "direction", "primary_type", "secondary_type", "comments",
                                         "rental", "uncertain", "relative_position"])
     observations = observations.sort("abs_time").rename({"abs_time": "observation_time"})
-    return observations
+    # Store whether each observation is a pedestrian, so that they can be filtered out with a boolean test when opening
+    observations = observations.with_columns(is_pedestrian=pl.col("primary_type") == "Pedestrian")
+    return observations.collect()
@@ -1,10 +1,10 @@
 import polars as pl
 
-from thesis.files import BASE_PATH
+from thesis.files import BASE_PATH, sink_per_location
 from thesis.files.filtering import SUMMARY_FILE
 
 
-def unite_summary() -> pl.DataFrame:
+def unite_summary() -> pl.LazyFrame:
     """
     Load all the summary files and merge them into a single dataframe with a ``location`` column.
     """
@@ -12,25 +12,24 @@ def unite_summary() -> pl.DataFrame:
 
     TRAJECTORY_PARENT_DIR = BASE_PATH.joinpath("data/trajectories/source/")
 
-    # Add locations and unite everything into a single dataframe
-    location_type = pl.Enum(Location)
-    rk = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("1_Riddarhuskajen_summary.csv"))
-    rk = rk.with_columns(location=pl.lit(Location.RIDDARHUSKAJEN, dtype=location_type))
+    files = {
+        str(TRAJECTORY_PARENT_DIR.joinpath("1_Riddarhuskajen_summary.csv")): Location.RIDDARHUSKAJEN,
+        str(TRAJECTORY_PARENT_DIR.joinpath("2_RiddarholmsbronN_summary.csv")): Location.RIDDARHOLMSBRON_N,
+        str(TRAJECTORY_PARENT_DIR.joinpath("3_RiddarholmsbronS_summary.csv")): Location.RIDDARHOLMSBRON_S
+    }
 
-    rb_n = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("2_RiddarholmsbronN_summary.csv"))
-    rb_n = rb_n.with_columns(location=pl.lit(Location.RIDDARHOLMSBRON_N, dtype=location_type))
-
-    rb_s = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("3_RiddarholmsbronS_summary.csv"))
-    rb_s = rb_s.with_columns(location=pl.lit(Location.RIDDARHOLMSBRON_S, dtype=location_type))
-
-    united = pl.concat([rk, rb_n, rb_s]).collect()
+    # Read all files in a single scan and add the location based on the file each row came from
+    united = pl.scan_csv(list(files), include_file_paths="source_file")
+    united = united.with_columns(
+        location=pl.col("source_file").replace_strict(files, return_dtype=pl.Enum(Location))
+    ).drop("source_file")
     return united
 
 
 def preprocess_summary():
     from thesis.model.enums import Direction
 
-    summary = unite_summary()
+    summary = unite_summary().collect()
 
     # Convert Type from int to string enum
     type_label_enum = pl.Enum(["Bicycle", "Pedestrian"])
@@ -94,4 +93,4 @@ def preprocess_summary():
         "ExcludedTJ": "excluded"
     })
     
-    summary.write_parquet(SUMMARY_FILE, partition_by="location")
+    sink_per_location(summary.lazy(), SUMMARY_FILE, compression="snappy", statistics=True)
@@ -1,10 +1,10 @@
 import polars as pl
 
-from thesis.files import BASE_PATH
+from thesis.files import BASE_PATH, sink_per_location
 from thesis.files.trajectories import TRAJECTORIES_LOCATION
 
 
-def unite_trajectories() -> pl.DataFrame:
+def unite_trajectories() -> pl.LazyFrame:
     """
     Loads the separate csv files and combines them into a single dataframe with a location column.
     :return: Combined dataframe with location column.
@@ -15,18 +15,17 @@ def unite_trajectories() -> pl.DataFrame:
 
     TRAJECTORY_PARENT_DIR = BASE_PATH.joinpath("data/trajectories/source/")
 
-    # Add locations and unite everything into a single dataframe
-    location_type = pl.Enum(Location)
-    rk = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("1_Riddarhuskajen.csv"))
-    rk = rk.with_columns(location=pl.lit(Location.RIDDARHUSKAJEN, dtype=location_type))
-
-    rb_n = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("2_RiddarholmsbronN.csv"))
-    rb_n = rb_n.with_columns(location=pl.lit(Location.RIDDARHOLMSBRON_N, dtype=location_type))
-
-    rb_s = pl.scan_csv(TRAJECTORY_PARENT_DIR.joinpath("3_RiddarholmsbronS.csv"))
-    rb_s = rb_s.with_columns(location=pl.lit(Location.RIDDARHOLMSBRON_S, dtype=location_type))
-
-    united = pl.concat([rk, rb_n, rb_s]).collect()
+    files = {
+        str(TRAJECTORY_PARENT_DIR.joinpath("1_Riddarhuskajen.csv")): Location.RIDDARHUSKAJEN,
+        str(TRAJECTORY_PARENT_DIR.joinpath("2_RiddarholmsbronN.csv")): Location.RIDDARHOLMSBRON_N,
+        str(TRAJECTORY_PARENT_DIR.joinpath("3_RiddarholmsbronS.csv")): Location.RIDDARHOLMSBRON_S
+    }
+
+    # Read all files in a single scan and add the location based on the file each row came from
+    united = pl.scan_csv(list(files), include_file_paths="source_file")
+    united = united.with_columns(
+        location=pl.col("source_file").replace_strict(files, return_dtype=pl.Enum(Location))
+    ).drop("source_file")
     return united
 
 
@@ -42,7 +41,7 @@ def preprocess_trajectories():
     # Convert direction into an enum
     from thesis.model.enums import Direction
 
-    trajectories = unite_trajectories()
+    trajectories = unite_trajectories().collect()
 
     trajectories = trajectories.with_columns(
         # Convert into datetime and add timezone information
@@ -54,7 +53,9 @@ def preprocess_trajectories():
         # Convert path to boolean, 0 means inside path and 1 outside path, so add not to interpret it as in_path
         ~pl.col("Path").cast(pl.Boolean),
         # Convert direction into an enum
-        pl.col("Direction").cast(Direction)
+        pl.col("Direction").cast(Direction),
+        # Coordinates and kinematics do not need double precision, halve their size
+        pl.col("X", "Y", "Speed", "Acc", "Theta").cast(pl.Float32)
     )
 
     # Remove the type code, keep only type name and cast as enum type
@@ -62,6 +63,8 @@ def preprocess_trajectories():
     trajectories = trajectories.drop("Type").rename({"Type_Label": "type"}).with_columns(
         pl.col("type").cast(type_label_enum)
     )
+    # Store whether each point is a pedestrian, so that they can be filtered out with a boolean test when opening
+    trajectories = trajectories.with_columns(is_pedestrian=pl.col("type") == "Pedestrian")
 
     # Rename columns with multiple words  
     trajectories = trajectories.rename({
@@ -83,8 +86,13 @@ def preprocess_trajectories():
     important_columns.extend(unimportant_columns)
     trajectories = trajectories.select(important_columns)
 
+    # Sort by the columns used in joins and filters, so that the row group statistics can be used to skip row groups
+    trajectories = trajectories.sort(["location", "ID", "time"])
+
     # Write as a parquet file
-    trajectories.write_parquet(TRAJECTORIES_LOCATION,
-                               partition_by="location")
+    sink_per_location(trajectories.lazy(), TRAJECTORIES_LOCATION,
+                      compression="snappy",
+                      row_group_size=200_000,
+                      statistics=True)
 
     return trajectories
@@ -8,6 +8,7 @@ from thesis.files.processed import (create_results_per_datapoint, create_results
                                     save_results_per_id, add_results_per_id, add_results_per_datapoint)
 from thesis.files.trajectories import open_trajectories
 from thesis.model.enums import Location
+from thesis.files import assert_unique_keys
 from thesis.processing.infrastructure import calculate_width, calculate_elevation
 from thesis.processing.interactions import calculate_following_meeting_ids
 from thesis.processing.interactions.meeting import calculate_meeting_statistics
@@ -22,12 +23,12 @@ def save_all_results() -> None:
     Produces all the results of the processing
     :return: 
     """
-    trajectories = open_trajectories().lazy()
+    # Read the trajectories once and reuse them for all the calculations
+    trajectories = open_trajectories().collect().lazy()
     save_matches()
     save_all_results_per_datapoint(trajectories)
     save_all_results_per_trajectory(trajectories)
     # Add is the information we previously calculated to the dataframe
-    trajectories = open_trajectories().lazy()
     trajectories = add_results_per_id(trajectories)
     trajectories = add_results_per_datapoint(trajectories)
     trajectories = add_matches(trajectories)
@@ -38,22 +39,28 @@ def save_all_results() -> None:
 
 def save_matches() -> None:
     from thesis.processing.observation_matching.graph import calculate_match_all
-    from thesis.files.observation_matching import _MATCHES_FILE
+    from thesis.files.observation_matching import _MATCHES_FILE, open_all_matches
     save_crossing_times()
     matches = calculate_match_all()
+    # Matched trajectories are joined on these keys, so ensure each one is matched only once
+    assert_unique_keys(matches.filter(pl.col("ID").is_not_null()), ["location", "ID", "direction"], "matches")
     matches.write_parquet(_MATCHES_FILE)
+    # Make sure the new matches are used
+    open_all_matches.cache_clear()
 
 
 def save_crossing_times() -> None:
     from thesis.processing.crossing_times import calculate_crossing_times_riddarhuskajen, \
         calculate_crossing_times_riddarhusbron_n
-    rk = calculate_crossing_times_riddarhuskajen().with_columns(location=pl.lit(Location.RIDDARHUSKAJEN).cast(Location))
-    rb_n = calculate_crossing_times_riddarhusbron_n().with_columns(
-        location=pl.lit(Location.RIDDARHOLMSBRON_N).cast(Location))
-    rk.vstack(rb_n, in_place=True)
-    # Sort by location and crossing time
-    rk = rk.sort(by=["location", "crossing_time", "ID"])
-    rk.write_parquet(_CROSSING_TIMES_FILE)
+    location_type = pl.Enum(Location)
+    rk = calculate_crossing_times_riddarhuskajen().lazy().with_columns(
+        location=pl.lit(Location.RIDDARHUSKAJEN, dtype=location_type))
+    rb_n = calculate_crossing_times_riddarhusbron_n().lazy().with_columns(
+        location=pl.lit(Location.RIDDARHOLMSBRON_N, dtype=location_type))
+    # Sort by location and crossing time while writing
+    (pl.concat([rk, rb_n])
+     .sort(by=["location", "crossing_time", "ID"])
+     .sink_parquet(_CROSSING_TIMES_FILE))
 
 
 def save_all_results_per_datapoint(trajectories: pl.LazyFrame) -> None:
@@ -85,18 +92,18 @@ def save_all_results_per_trajectory(trajectories: pl.LazyFrame) -> None:
     index_cols = ["location", "ID"]
 
     # Calculate interactions
-    fol_meetings = calculate_following_meeting_ids(trajectories).collect()
+    fol_meetings = calculate_following_meeting_ids(trajectories).collect(engine="streaming")
     save_results_per_id(fol_meetings.select(*index_cols, "meeting_ids"))
     save_results_per_id(fol_meetings.select(*index_cols, "following_ids"))
 
 
-    overtakes = calculate_overtakes(trajectories).collect()
+    overtakes = calculate_overtakes(trajectories)
     save_results_per_id(overtakes.select(*index_cols, "overtakes_id"))
 
-    cuts_corner = calculate_cuts_corner(trajectories).collect()
+    cuts_corner = calculate_cuts_corner(trajectories)
     save_results_per_id(cuts_corner.select(*index_cols, "cuts_corner"))
 
-    line_crossing_info = calculate_crossings_into_opposite_lane(trajectories).collect()
+    line_crossing_info = calculate_crossings_into_opposite_lane(trajectories)
     save_results_per_id(line_crossing_info.select([*index_cols, "line_crossing_info"]))
 
 
@@ -107,9 +114,9 @@ def save_interaction_calculations(trajectories: pl.LazyFrame) -> None:
     :return: 
     """
 
-    following = calculate_following_parameters(trajectories).collect()
+    following = calculate_following_parameters(trajectories)
     save_results_per_datapoint(following)
-    meeting_info = calculate_meeting_statistics(trajectories).collect()
+    meeting_info = calculate_meeting_statistics(trajectories)
     save_results_per_id(meeting_info.select("location", "ID", "meeting_info"))
-    overtake_info = calculate_overtake_info(trajectories).collect()
+    overtake_info = calculate_overtake_info(trajectories)
     save_results_per_id(overtake_info.select("location", "ID", "overtake_info"))
\ No newline at end of file
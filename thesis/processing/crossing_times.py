@@ -1,6 +1,8 @@
+from typing import Optional
+
 import numpy as np
 import polars as pl
-from numba import guvectorize, float64
+from numba import njit, prange
 
 import thesis.files.crossing_times
 import thesis.files.trajectories
@@ -8,76 +10,101 @@ from thesis.model.enums import Location
 from thesis.model.exprs import is_off_peak
 
 
-@guvectorize([(float64[:], float64[:], float64[:], float64[:], float64[:])], "(n),(n),(m),(m)->()")
-def line_intersection_index(x, y, l0, l1, res) -> None:
+# Compiled when the module is imported and stored in the on-disk cache, so later runs load the compiled kernel
+# instead of compiling it again on the first call
+@njit("void(float64[:], float64[:], int64[:], float64[:], int64[:], float64[:, :], float64[:, :], "
+      "int64[:], float64[:], boolean[:])", parallel=True, cache=True)
+def _crossing_points(x, y, time, dist_east, offsets, l0, l1, out_time, out_dist_east, out_found) -> None:
     """
-    Given a sequence of (X,Y) pairs calculate the intersection point with the given line.
-    When mapping returns a column of one-element arrays.
-    
-    :param x: List of X coordinates of the points.
-    :param y: List of Y coordinates of the points.
-    :param l0: 2-element array with (X,Y) coordinates of the first point of the  line.
-    :param l1: 2-element array with (X,Y) coordinates of the second point of the  line.
-    :param res: See return
-    :return : One-element array with the index of the point before the intersection (intersection occurs between this 
-    point and the next). -1 if no intersection occurs.
+    Find where many trajectories, stored one after the other in flat arrays, cross their line.
+    Trajectories are processed in parallel.
+
+    :param x: X coordinates of the points of all trajectories.
+    :param y: Y coordinates of the points of all trajectories.
+    :param time: Time of the points of all trajectories, as integers.
+    :param dist_east: Distance to the eastern edge of the path of the points of all trajectories.
+    :param offsets: Start of each trajectory in the point arrays, followed by the total number of points.
+    :param l0: Array with the (X,Y) coordinates of the first point of the line crossed by each trajectory.
+    :param l1: Array with the (X,Y) coordinates of the second point of the line crossed by each trajectory.
+    :param out_time: Filled with the time of the point before the intersection in each trajectory.
+    :param out_dist_east: Filled with the dist_east of the point before the intersection in each trajectory.
+    :param out_found: Filled with whether each trajectory crosses its line. If not, the other outputs are undefined.
     """
-    # https://stackoverflow.com/questions/563198/how-do-you-detect-where-two-line-segments-intersect
-    s2 = (l1[0] - l0[0], l1[1] - l0[1])
-    for i in range(len(x)-1):
-        s1 = (x[i + 1] - x[i + 0], y[i + 1] - y[i + 0])
-
-        if (-s2[0] * s1[1] + s1[0] * s2[1]) == 0:
-            continue
-        s = (-s1[1] * (x[i + 0] - l0[0]) + s1[0] * (y[i + 0] - l0[1])) / (-s2[0] * s1[1] + s1[0] * s2[1])
-        t = (s2[0] * (y[i + 0] - l0[1]) - s2[1] * (x[i + 0] - l0[0])) / (-s2[0] * s1[1] + s1[0] * s2[1])
-
-        if 0 <= s <= 1 and 0 <= t <= 1:
-            # res[0] = x[i+0] + (t*s1[0])
-            # res[1] = y[i+0] + (t*s1[1])
-            res[0] = i
-            return
-    res[0] = -1
-    # res[1] = np.nan
+    for g in prange(len(offsets) - 1):
+        start, end = offsets[g], offsets[g + 1]
+        l0x, l0y = l0[g, 0], l0[g, 1]
+        s2x = l1[g, 0] - l0x
+        s2y = l1[g, 1] - l0y
+        out_found[g] = False
+        for i in range(start, end - 1):
+            s1x = x[i + 1] - x[i]
+            s1y = y[i + 1] - y[i]
+            denom = -s2x * s1y + s1x * s2y
+            if denom == 0:
+                continue
+            inv_denom = 1.0 / denom
+            s = (-s1y * (x[i] - l0x) + s1x * (y[i] - l0y)) * inv_denom
+            t = (s2x * (y[i] - l0y) - s2y * (x[i] - l0x)) * inv_denom
+            if 0 <= s <= 1 and 0 <= t <= 1:
+                out_time[g] = time[i]
+                out_dist_east[g] = dist_east[i]
+                out_found[g] = True
+                break
 
 
 def calculate_crossing_times(trajectories: pl.DataFrame, l0: tuple[float, float],
-                             l1: tuple[float, float]) -> pl.DataFrame:
+                             l1: tuple[float, float],
+                             alternative_line: Optional[tuple[tuple[float, float], tuple[float, float]]] = None,
+                             uses_alternative_line: Optional[pl.Expr] = None) -> pl.DataFrame:
     """
     Get the time each trajectory corsses the line given by l0, l1
     :param trajectories: 
     :param l0: (X,Y) coordinates of one edge of the line
     :param l1: (X,Y) coordinates of the other edge of the line
+    :param alternative_line: (X,Y) coordinates of the edges of a line crossed by some of the trajectories instead.
+    :param uses_alternative_line: Boolean expression, true for the trajectories which cross the alternative line.
+    Evaluated on the first point of each trajectory.
     :return: Dataframe with a row for each ID, crossing_time combination,
     """
-    # Keep the time column to get the crossing time after finding the index
-    # Group trajectories by ID and find the index of the point before the crossing
-    crossing_times = (trajectories.group_by("ID").
-    agg(
+    # Lay out the points of all trajectories one after the other, so that the points of each trajectory are given by
+    # its offset, without building list columns
+    points = trajectories.sort(["ID", "time"]).with_columns(
+        pl.when(pl.col("direction") == "Southbound").then("dist_left").otherwise("dist_right").alias("dist_east"))
+    crossing_times = points.group_by("ID", maintain_order=True).agg(
         # Points from the same trajectory should have the same direction
-        pl.col("time"), pl.col("direction").first(),
-        # Keep all dist_right as well as X,Y values for every point of the trajectory with the given ID
-        pl.when(pl.col("direction") == "Southbound").then("dist_left").otherwise("dist_right").alias("dist_east"),
-        pl.struct("X", "Y").
-        # Find the index of the point just before the intersection
-        map_batches(
-            lambda x: line_intersection_index(x.struct.field("X"), x.struct.field("Y"), np.array(l0), np.array(l1)),
-            return_dtype=pl.Float64)
-        .alias("intersection_index"))
-    # Convert the 1-element list to a simple value
-    .with_columns(
-        pl.col("intersection_index").explode().cast(pl.Int64)
-    ))
-    # Get the time corresponding to each crossing
-    crossing_times = crossing_times.with_columns(
-        pl.when(pl.col("intersection_index") > -1)
-        .then(pl.struct(
-            crossing_time=pl.col("time").list.get(pl.col("intersection_index")),
-            dist_east=pl.col("dist_east").list.get(pl.col("intersection_index"))
-        ))
-        .otherwise(None).struct.unnest()).drop(["time", "intersection_index"])
-    # Reorder columns and sort by time
-    crossing_times = crossing_times.sort(by="crossing_time").select(["ID", "direction", "crossing_time", "dist_east"])
+        pl.len().alias("n_points"), pl.col("direction").first(),
+        (pl.lit(False) if uses_alternative_line is None else uses_alternative_line).first()
+        .alias("uses_alternative_line"))
+    offsets = np.zeros(crossing_times.height + 1, dtype=np.int64)
+    np.cumsum(crossing_times["n_points"].to_numpy(), out=offsets[1:])
+    x = points["X"].to_numpy().astype(np.float64)
+    y = points["Y"].to_numpy().astype(np.float64)
+    # Line crossed by each trajectory
+    line_l0 = np.tile(np.array(l0, dtype=np.float64), (crossing_times.height, 1))
+    line_l1 = np.tile(np.array(l1, dtype=np.float64), (crossing_times.height, 1))
+    if alternative_line is not None:
+        alternative = crossing_times["uses_alternative_line"].to_numpy()
+        line_l0[alternative] = alternative_line[0]
+        line_l1[alternative] = alternative_line[1]
+    # Get the time and distance at the point just before the intersection for every trajectory at once
+    # The kernel is compiled for writable arrays
+    time = points["time"].to_physical().to_numpy(writable=True)
+    dist_east = points["dist_east"].cast(pl.Float64).to_numpy(writable=True)
+    crossing_time = np.empty(crossing_times.height, dtype=np.int64)
+    crossing_dist_east = np.empty(crossing_times.height, dtype=np.float64)
+    found = np.empty(crossing_times.height, dtype=np.bool_)
+    _crossing_points(x, y, time, dist_east, offsets, line_l0, line_l1, crossing_time, crossing_dist_east, found)
+    # Build the result directly from the kernel outputs, null for trajectories which do not cross the line
+    not_found = pl.Series(~found)
+    crossing_times = pl.DataFrame({
+        "ID": crossing_times["ID"],
+        "direction": crossing_times["direction"],
+        "crossing_time": pl.Series(crossing_time).cast(points.schema["time"]).set(not_found, None),
+        "dist_east": (pl.Series(crossing_dist_east).fill_nan(None).cast(points.schema["dist_east"])
+                      .set(not_found, None))
+    })
+    # Sort by time
+    crossing_times = crossing_times.sort(by="crossing_time")
     return crossing_times
 
 
@@ -92,17 +119,14 @@ def calculate_crossing_times_riddarhuskajen() -> pl.DataFrame:
         (1100 / 477, 750 / 53)
     )
 
-    trajectories = thesis.files.trajectories.open_trajectories(Location.RIDDARHUSKAJEN)
+    trajectories = thesis.files.trajectories.open_trajectories(Location.RIDDARHUSKAJEN).collect()
 
     uses_northbound_line = (pl.col("direction") == "Northbound").or_(is_off_peak("time"))
 
-    northbound = trajectories.filter(uses_northbound_line)
-    crossings_northbound = calculate_crossing_times(northbound, line_points_nb[0], line_points_nb[1])
-
-    southbound = trajectories.filter(~uses_northbound_line)
-    crossings_southbound = calculate_crossing_times(southbound, line_points_sb_op[0], line_points_sb_op[1])
-
-    crossing_times = pl.concat([crossings_northbound, crossings_southbound])
+    # Southbound trajectories outside off-peak cross the other line, handle both in a single pass
+    crossing_times = calculate_crossing_times(trajectories, line_points_nb[0], line_points_nb[1],
+                                              alternative_line=line_points_sb_op,
+                                              uses_alternative_line=~uses_northbound_line)
     
     return crossing_times
 
@@ -112,6 +136,6 @@ def calculate_crossing_times_riddarhusbron_n() -> pl.DataFrame:
         (-5900 / 941, -530 / 941),
         (-1950 / 941, -3730 / 941)
     )
-    trajectories = thesis.files.trajectories.open_trajectories(Location.RIDDARHOLMSBRON_N)
+    trajectories = thesis.files.trajectories.open_trajectories(Location.RIDDARHOLMSBRON_N).collect()
     crossing_times = calculate_crossing_times(trajectories, line_points[0], line_points[1])
     return crossing_times
\ No newline at end of file
@@ -27,11 +27,17 @@ def _calculate_feature(trajectories: pl.LazyFrame, feature: pl.DataFrame, featur
     :param feature_name: Name of the feature.
     :return: DataFrame with ``location``, ``ID``, ``time`` and ``<feature_name>`` columns.
     """
-    feature = feature.lazy()
-
-    trajectories = trajectories.join(feature, on=["location"], how="full").filter(
-        pl.col("long_pos").is_between(pl.col("from_long_pos"), pl.col("to_long_pos"), closed="left")
+    # The slope is constant for each section, so calculate it once for the section instead of for each datapoint
+    feature = feature.lazy().sort("location", "from_long_pos").with_columns(
+        ((pl.col(f"{feature_name}_m_end") - pl.col(f"{feature_name}_m_start")) /
+         (pl.col("to_long_pos") - pl.col("from_long_pos"))).alias(f"{feature_name}_slope")
     )
+
+    # The sections of each location do not overlap, so the section containing each datapoint is the last one starting
+    # before it, as long as the datapoint is also before its end
+    trajectories = trajectories.sort("location", "long_pos").join_asof(
+        feature, by="location", left_on="long_pos", right_on="from_long_pos", strategy="backward"
+    ).filter(pl.col("long_pos") < pl.col("to_long_pos"))
     
     # Interpolate linearly between values when the width is variable
     feature = trajectories.with_columns(linear_interpolation(feature_name).round(2).alias(feature_name))
@@ -45,12 +51,11 @@ def linear_interpolation(feature_name: str) -> pl.Expr:
     """
     Interpolate linearly between longitudinal position and infrastructure feature values according to the formula 
     
-    :math:`y = (y_0 (x_1-x) + y_1*(x-x_0)/(x_1 - x_0)`.
-    :param feature_name: Feature name as it appears in the ``m_start`` and ``m_end`` columns
+    :math:`y = y_0 + (x-x_0) (y_1 - y_0)/(x_1 - x_0)`.
+    :param feature_name: Feature name as it appears in the ``m_start`` and ``slope`` columns
     """
     x0 = pl.col("from_long_pos")
-    x1 = pl.col("to_long_pos")
     y0 = pl.col(f"{feature_name}_m_start")
-    y1 = pl.col(f"{feature_name}_m_end")
+    slope = pl.col(f"{feature_name}_slope")
     x = pl.col("long_pos")
-    return (y0 * (x1 - x) + y1 * (x - x0)) / (x1 - x0)
+    return y0 + slope * (x - x0)
@@ -2,6 +2,7 @@ from typing import Optional
 
 import polars as pl
 
+from thesis.model.enums import Direction, Constrained_Type
 from thesis.processing.interactions.following import _calculate_following_trajectories
 from thesis.processing.interactions.meeting import _calculate_meeting_trajectories
 
@@ -16,8 +17,13 @@ def calculate_following_meeting_ids(trajectories: pl.LazyFrame,
     :return: Dataframe with ``location``, ``ID``, ``meeting_ids`` and ``following_ids`` columns.
     """
 
-    # Cast to 16-bit unsigned integer to save memory
-    trajectories = trajectories.with_columns(pl.col("ID").cast(pl.UInt16))
+    # Only these columns are needed to find the interactions, so drop the rest before sorting and windowing.
+    trajectories = trajectories.select("location", "ID", "time", "direction", "long_pos")
+
+    # Cast to 16-bit unsigned integer to save memory.
+    # Longitudinal positions have one decimal, so they are used as integer decimetres in the join and group keys.
+    trajectories = trajectories.with_columns(pl.col("ID").cast(pl.UInt16), pl.col("direction").cast(Direction),
+                                             long_pos_dm=(pl.col("long_pos") * 10).round().cast(pl.Int32))
 
     # Sort the trajectories by their time to apply the rolling function
     trajectories = trajectories.sort("time")
@@ -44,5 +50,5 @@ def add_constrained_type(trajectories: pl.LazyFrame) -> pl.LazyFrame:
         pl.col("following_ids").list.len() > 0).then(pl.lit("Both, does not overtake"))
                         .when(pl.col("meeting_ids").list.len() > 0).then(pl.lit("Only meeting"))
                         .when(pl.col("following_ids").list.len() > 0).then(pl.lit("Only following"))
-                        .otherwise(pl.lit("Unconstrained")).cast(pl.Categorical))
+                        .otherwise(pl.lit("Unconstrained")).cast(Constrained_Type))
     return trajectories.with_columns(constrained=constrained_type)
@@ -10,14 +10,15 @@ def _calculate_following_trajectories(trajectories: pl.LazyFrame, headway_thresh
     # To find if a trajectory is constrained by any trajectory in the same direction for every timestamp, we check the
     # trajectories that had the same longitudinal position in the last 5s.
     # Those are the trajectories that the bike is following.
-    # As the same timestamp can appear multiple times, but the result is the same, keep only unique rows
+    # As the same timestamp can appear multiple times, but the result is the same, keep only unique rows.
+    # Rows with the same keys have the same window, so compare only the keys instead of hashing the lists.
     following = trajectories.rolling(period=timedelta(seconds=headway_threshold), index_column="time",
-                                     group_by=["location", "direction", "long_pos"], closed="left").agg(
+                                     group_by=["location", "direction", "long_pos_dm"], closed="left").agg(
         pl.col("ID").unique().alias("following_ids")
-    ).unique()
+    ).unique(subset=["location", "direction", "long_pos_dm", "time"], keep="any")
 
     # Join the main trajectories dataframe and for each entry remove its ID number if it appears in the following IDs
-    trajectories = trajectories.join(following, on=["location", "direction", "long_pos", "time"],
+    trajectories = trajectories.join(following, on=["location", "direction", "long_pos_dm", "time"],
                                      how="left").with_columns(
         pl.col("following_ids").list.set_difference(pl.col("ID"))
     )
@@ -58,13 +59,14 @@ def calculate_following_parameters(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     # For each datapoint, we want to add where the followed trajectory was at that moment
     # Keep direction as it is necessary during processing, following and followed trajectories have the same value
     # anyway.
+    # Filter after the join, since a trajectory might be following another that is not following anything.
+    # Keep only trajectories in path, before calculating any statistics for them.
     following = (following.join(following.drop("following_id"), how="inner",
                                 left_on=["location", "time", "following_id"],
                                 right_on=["location", "time", "ID"], suffix="_ahead")
-                 .filter(pl.col("following_id").is_not_null()))
-    # Keep only trajectories in path
-    following = following.filter(pl.col("in_path"), pl.col("in_path_ahead"))
-    # Filter after the join, since a trajectory might be following another that is not following anything. 
+                 .filter(pl.col("following_id").is_not_null(), pl.col("in_path"), pl.col("in_path_ahead"))
+                 .with_columns(direction_sign=pl.when(pl.col("direction") == "Southbound").then(-1).otherwise(1)
+                               .cast(pl.Int8)))
     # Calculate statistics
     # In southbound trajectories, the bike ahead has a smaller long_dist.
     # long_distance = pl.when(pl.col("direction") == "Southbound").then(
@@ -73,43 +75,40 @@ def calculate_following_parameters(trajectories: pl.LazyFrame) -> pl.LazyFrame:
 
     # In southbound trajectories both values are negative and smaller values are further from the centreline, so we
     # invert the sign again to make it left/right relative to the following cyclist.
-    lateral_dev = pl.when(pl.col("direction") == "Southbound").then(
-        -(pl.col("lat_pos_ahead") - pl.col("lat_pos"))
-    ).otherwise(pl.col("lat_pos_ahead") - pl.col("lat_pos")).alias("following_lateral_deviation")
+    lateral_dev = (pl.col("direction_sign") * (pl.col("lat_pos_ahead") - pl.col("lat_pos"))).alias(
+        "following_lateral_deviation")
 
     # Do not add square root
     # long_dist^2 = dist^2 - lat_dist^2
     xy_dist = ((pl.col("X") - pl.col("X_ahead")).pow(2) + (pl.col("Y") - pl.col("Y_ahead")).pow(2))
-    long_distance = (xy_dist - lateral_dev.pow(2)).sqrt()
-    # We need to invert the sign if the bike ahead is actually behind
-    invert_sign_northbound = (pl.col("direction") == "Northbound") & ((pl.col("long_pos") > pl.col("long_pos_ahead"))
-                              | ((pl.col("long_pos") == pl.col("long_pos_ahead")) & (pl.col("Y") < pl.col("Y_ahead"))))
-    invert_sign_southbound = (pl.col("direction") == "Southbound") & ((pl.col("long_pos") < pl.col("long_pos_ahead"))
-                              | ((pl.col("long_pos") == pl.col("long_pos_ahead")) & (pl.col("Y") > pl.col("Y_ahead"))))
-    long_distance = pl.when(invert_sign_southbound | invert_sign_northbound).then(-long_distance).otherwise(
-        long_distance
-    ).alias("following_long_dist")
+    # Keep the squared distance, which orders the trajectories ahead in the same way, and take the square root only for
+    # the closest one. A negative value has no square root, so it becomes NaN as the square root would.
+    long_distance_sq = xy_dist - lateral_dev.pow(2)
+    long_distance_sq = pl.when(long_distance_sq >= 0).then(long_distance_sq).otherwise(float("nan")).alias(
+        "following_long_dist_sq")
+    # The bike ahead is actually behind
+    # Multiplying by the direction sign makes the comparisons the same for both directions.
+    is_behind = ((pl.col("direction_sign") * (pl.col("long_pos") - pl.col("long_pos_ahead")) > 0)
+                 | ((pl.col("long_pos") == pl.col("long_pos_ahead"))
+                    & (pl.col("direction_sign") * (pl.col("Y") - pl.col("Y_ahead")) < 0))).alias("is_behind")
 
     speed_diff = (pl.col("speed_ahead") - pl.col("speed")).alias("following_speed_difference")
 
     following = _calculate_time_headway(trajectories, following)
-    following = following.with_columns(long_distance, lateral_dev, speed_diff).unique()
+    following = following.with_columns(long_distance_sq, is_behind, lateral_dev, speed_diff).unique()
     
-    # Remove negative
-    following = following.filter(pl.col("following_long_dist") > 0,
+    # Remove negative, which are the bikes behind. NaN distances are kept, since they have no sign.
+    following = following.filter(pl.col("following_long_dist_sq") > 0,
+                                 ~pl.col("is_behind") | pl.col("following_long_dist_sq").is_nan(),
                                  pl.col("following_time_headway") > 0)
     
     # Since each trajectory can only follow one trajectory at time, for each datapoint, keep only the closest trajectory
-    # ahead
-    following = following.group_by(["location", "time","ID"]).agg(
-        pl.all().sort_by("following_long_dist").first()
-    )
-    
-    
-    # Collect everything into a single column 
+    # ahead and collect everything into a single column.
+    # All the remaining distances are positive.
     following = following.group_by(["location", "time", "ID"]).agg(
-        pl.struct("following_id", "following_long_dist", "following_lateral_deviation",
-                  "following_speed_difference", "following_time_headway").alias("following_info")
+        pl.struct("following_id", pl.col("following_long_dist_sq").sqrt().alias("following_long_dist"),
+                  "following_lateral_deviation", "following_speed_difference", "following_time_headway")
+        .sort_by("following_long_dist_sq").head(1).alias("following_info")
     )
     return following
 
@@ -118,6 +117,7 @@ def _calculate_time_headway(all_trajectories: pl.LazyFrame, following: pl.LazyFr
     # To calculate the time headway,
     # we need to find out when the trajectory ahead crossed the same longitudinal position
     # Interpolate the trajectories ahead. We don't care about speed the function just wants a parameter.
+    ahead_columns = ["location", "ID", "long_pos", "time"]
     if interpolate:
         # Interpolate only IDs that are being followed
         all_trajectories = all_trajectories.join(following,
@@ -125,8 +125,9 @@ def _calculate_time_headway(all_trajectories: pl.LazyFrame, following: pl.LazyFr
                                                  how="semi")
         # The function does not currently accept empty interpolation, so interpolate speed
         all_trajectories = interpolate_for_long_pos(all_trajectories, ["speed"])
+        ahead_columns.append(pl.col("interpolated").alias("following_headway_interpolated"))
 
-    following = following.join(all_trajectories.select("location", "ID", "long_pos", "time"),
+    following = following.join(all_trajectories.select(ahead_columns),
                                how="inner",
                                left_on=["location", "following_id", "long_pos"],
                                right_on=["location", "ID", "long_pos"], suffix="_ahead")
@@ -134,7 +135,4 @@ def _calculate_time_headway(all_trajectories: pl.LazyFrame, following: pl.LazyFr
     # The time the trajectory ahead crossed will be lower than the time this trajectory crossed,
     # so invert the sign to make it a positive number.
     time_headway = (pl.col("time") - pl.col("time_ahead")).dt.total_milliseconds().alias("following_time_headway")
-    if interpolate:
-        interpolated = pl.col("interpolated_ahead").alias("following_headway_interpolated")
-        following = following.with_columns(interpolated)
     return following.with_columns(time_headway)
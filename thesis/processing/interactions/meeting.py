@@ -25,14 +25,17 @@ def calculate_meeting_statistics(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     # Due to the aggregation of long_pos into discrete values every 0.5m some meetings might create duplicate rows
     # (duplicate long_pos and/or long_pos_opposite).
     # To have just one entry per meeting, calculate the average of the rest of the columns.
+    # Only the positions are used afterward, so only those are averaged.
     meetings = meetings.group_by("location", "ID", "meeting_id").agg(
-        pl.selectors.numeric().mean()
+        pl.col("meeting_long_pos", "lat_pos", "lat_pos_opposite").mean()
     )
+    # Keep only bikes on opposite sides of the centreline, before calculating anything for them.
+    # The rows of a meeting do not necessarily share the sign of lat_pos, so this is done on the averages.
+    meetings = meetings.filter(pl.col("lat_pos") * pl.col("lat_pos_opposite") < 0)
     # Calculate the distance between the bikes
     lateral_distance = (abs(pl.col("lat_pos") - pl.col("lat_pos_opposite"))).alias("meeting_lateral_dist")
     meetings = meetings.with_columns(lateral_distance)
     # lateral_distances = meetings.group_by("location", "ID").agg(pl.col("meeting_lateral_dist").sort_by("meeting_id"))
-    meetings = meetings.filter(pl.col("lat_pos") * pl.col("lat_pos_opposite") < 0)
     
     # Calculate the relative positions for each meeting
     meetings = meetings.select("location", "ID", "meeting_id", "meeting_long_pos", "meeting_lateral_dist")
@@ -51,34 +54,24 @@ def calculate_meeting_statistics(trajectories: pl.LazyFrame) -> pl.LazyFrame:
 
 def _calculate_meeting_trajectories(trajectories: pl.LazyFrame, headway_threshold: Optional[int] = 5) -> pl.LazyFrame:
     meeting = trajectories.rolling(offset="0s", period=timedelta(seconds=headway_threshold), index_column="time",
-                                   group_by=["location", "long_pos"], closed="both").agg(
-        # For each timestamp we see if there are multiple direction values.
+                                   group_by=["location", "long_pos_dm"], closed="both").agg(
+        # For each timestamp keep the trajectories crossing the longitudinal position within the next threshold
+        # seconds, separately for each direction.
         # We use closed=both to include the observations directly on the timestamp, to include the exact point of the
         # meeting if two trajectories are in the same long_pos.
-        (pl.col("direction").n_unique() > 1).alias("is_meeting"),
-        # Keep information about all trajectories crossing the longitudinal position within the next threshold seconds.
-        pl.struct(meeting_ids=pl.col("ID"), meeting_direction=pl.col("direction")).unique().alias("meeting_info")
-        # Create a dataframe containing a row for each crossing at each timestamp within the threshold
-    ).filter(pl.col("is_meeting")).explode("meeting_info").unnest("meeting_info")
+        pl.col("ID").filter(pl.col("direction") == "Northbound").alias("northbound_ids"),
+        pl.col("ID").filter(pl.col("direction") == "Southbound").alias("southbound_ids")
+        # Trajectories at the same position and time share the same window
+    ).unique(subset=["location", "long_pos_dm", "time"], keep="any")
 
-    # Join meetings to the main trajectories dataframe and for every observation remove other observations going in
-    # the same direction
-    meeting = trajectories.select(
-        ["location", "ID", "time", "long_pos", "direction"]
-    ).join(
-        # For each time and longitudinal position combination, add all the trajectories that met during the window
-        # to all the trajectories crossing the longitudinal position at that time.
-        meeting, on=["location", "long_pos", "time"], how="inner"
-    ).filter(
-        # Keep only meetings where the trajectories travel in opposite directions
-        (pl.col("meeting_direction") != pl.col("direction"))
-        # Remove unnecessary columns and keep only a list with the IDs of meeting trajectories
-    ).drop(["meeting_direction", "is_meeting", "direction"]).group_by(["location", "ID", "time", "long_pos"]).all()
-
-    # Add information about meeting trajectories to each datapoint (defined by id, longitudinal position and time)
-    trajectories = trajectories.join(meeting, on=["location", "ID", "long_pos", "time"], how="left").with_columns(
-        pl.col("meeting_ids").list.set_difference(pl.col("ID")).fill_null(pl.lit([],
-                                                                                 dtype=pl.List(pl.UInt16)))
-    )
+    # Add information about meeting trajectories to each datapoint (defined by id, longitudinal position and time).
+    # Only trajectories travelling in the opposite direction are meetings. If there are none the list is empty.
+    opposite_ids = (pl.when(pl.col("direction") == "Northbound").then(pl.col("southbound_ids"))
+                    .otherwise(pl.col("northbound_ids")))
+    trajectories = trajectories.join(meeting, on=["location", "long_pos_dm", "time"], how="left",
+                                     maintain_order="left").with_columns(
+        opposite_ids.list.set_difference(pl.col("ID")).fill_null(pl.lit([], dtype=pl.List(pl.UInt16)))
+        .alias("meeting_ids")
+    ).drop("northbound_ids", "southbound_ids")
 
     return trajectories
@@ -59,9 +59,10 @@ def calculate_overtakes(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     did_overtake = pl.col("other_time_behind") > pl.col("other_time_ahead")
     got_overtaken = pl.col("other_time_ahead") > pl.col("other_time_behind")
     # If trajectory y appears first behind and then ahead, that means that an overtake was done by trajectory y.
+    overtake_rel_type = pl.Enum(["did_overtake", "got_overtaken"])
     overtakes = overtakes.with_columns(overtake_rel=
-                                       pl.when(did_overtake).then(pl.lit("did_overtake", dtype=pl.Categorical))
-                                       .when(got_overtaken).then(pl.lit("got_overtaken", dtype=pl.Categorical)))
+                                       pl.when(did_overtake).then(pl.lit("did_overtake", dtype=overtake_rel_type))
+                                       .when(got_overtaken).then(pl.lit("got_overtaken", dtype=overtake_rel_type)))
     # Keep only information about the trajectories doing the overtake
     overtakes = (overtakes.filter(pl.col("overtake_rel") == "did_overtake")
                  .select("location", "ID", pl.col("ID_other").alias("overtakes_id")))
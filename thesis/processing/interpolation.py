@@ -31,16 +31,20 @@ def interpolate_for_long_pos(trajectories: pl.LazyFrame, col_interpolated: Itera
     interpolated = trajectories.group_by(["location", "ID"]).agg(
         pl.int_range(trajectory_min_long_pos*2, trajectory_max_long_pos*2 + 1).truediv(2).alias("long_pos")
     ).explode("long_pos")
-    # Join values which exist
-    interpolated = interpolated.join(trajectories, on=["location", "ID", "long_pos"], how="full")
-    # Interpolate within each trajectory
-    interpolated = interpolated.group_by(["location", "ID"]).agg(
-        pl.col("time").sort_by("long_pos").is_null().alias("interpolated"),
-        pl.col(*col_interpolated).sort_by("long_pos").interpolate(),
-        pl.col("time").sort_by("long_pos").interpolate(),
-        pl.col("long_pos").sort(),
-        pl.col(*col_forward).sort_by("long_pos").fill_null(strategy="forward")
-    ).explode("time", "long_pos", "interpolated", *col_forward, *col_interpolated)    
+    # Add only the positions without values to the existing datapoints, instead of joining the whole range with them
+    missing = interpolated.join(trajectories, on=["location", "ID", "long_pos"], how="anti")
+    interpolated = pl.concat([trajectories, missing], how="diagonal_relaxed")
+    # Interpolate within each trajectory.
+    # Sort once and use window expressions, so the columns stay in place instead of being aggregated and exploded.
+    trajectory = ["location", "ID"]
+    interpolated = interpolated.sort(*trajectory, "long_pos", maintain_order=True).select(
+        *trajectory,
+        pl.col("time").is_null().alias("interpolated"),
+        pl.col(*col_interpolated).interpolate().over(trajectory),
+        pl.col("time").interpolate().over(trajectory),
+        "long_pos",
+        pl.col(*col_forward).fill_null(strategy="forward").over(trajectory)
+    )
     return interpolated
 
 def deduplicate_by_long_pos(trajectories: pl.LazyFrame, deduplicate_mean: list[str],
@@ -65,9 +69,13 @@ def deduplicate_by_long_pos(trajectories: pl.LazyFrame, deduplicate_mean: list[s
     if "time" not in deduplicate_mean:
         deduplicate_mean.append("time")
     
-    trajectories = trajectories.group_by(["location", "ID", "long_pos"]).agg(
+    keys = ["location", "ID", "long_pos"]
+    # Most datapoints have a unique longitudinal position, so only the duplicates need to be aggregated
+    is_duplicated = pl.struct(keys).is_duplicated()
+    unique = trajectories.filter(~is_duplicated).select(*keys, *deduplicate_mean, *static_cols)
+    duplicated = trajectories.filter(is_duplicated).group_by(keys).agg(
         pl.col(*deduplicate_mean).mean(),
         pl.col(*static_cols).first()
     )
     
-    return trajectories
\ No newline at end of file
+    return pl.concat([unique, duplicated], how="vertical_relaxed")
\ No newline at end of file
@@ -4,7 +4,9 @@ Common methods used for observation matching
 import datetime
 from datetime import timedelta
 
+import numpy as np
 import polars as pl
+from numba import njit
 
 from thesis.model.enums import Relative_Position
 
@@ -13,43 +15,62 @@ def match_uncertain(crossing_times: pl.DataFrame, observations: pl.DataFrame) ->
     """
     Match trajectories which have exactly the same crossing time, using their relative position, if available.
     :param crossing_times: Unfiltered crossing times
-    :param observations: Unfiltered observations
+    :param observations: Unfiltered observations sorted by ``observation_time``
     :return: 2 element tuple containing the uncertain trajectories that were matched and the uncertain trajectories
              that were not matched, respectively. 
     """
     # Find trajectories for each direction, crossing time combination
-    # Save the IDs and the dist_east values of the trajectories into a struct and also the maximum distance
+    # Save the IDs, the dist_east values and the relative positions of the trajectories into a struct
+    # Build the whole pipeline lazily and collect it once at the end
     uncertain = (
-        crossing_times
+        crossing_times.lazy()
         # Find crossings with the same direction and crossing time
         .group_by(
             pl.col("direction"), pl.col("crossing_time"))
-        # For each group make a list with all the IDs and distances that have the same direction and crossing time
-        # and keep the observation with the longest distance from the right of the path
+        # For each group make a list with all the IDs and distances that have the same direction and crossing time.
+        # Based on which observation has the maximum dist_east, set its relative position within the group, so that
+        # the maximum does not need to be carried to every row after exploding.
         .agg(
-            pl.struct("ID", "dist_east").alias("matches"),
-            pl.col("dist_east").max().alias("max_dist_east")
+            pl.struct("ID", "dist_east",
+                      relative_position=pl.when(pl.col("dist_east") == pl.col("dist_east").max())
+                      .then(pl.lit("Back"))
+                      .otherwise(pl.lit("Front").cast(Relative_Position))).alias("matches")
         )
         # Keep only trajectories that have more than one matching crossing
         .filter(pl.col("matches").list.len() > 1, pl.col("crossing_time").is_not_null())
-        # Create one row for each ID, dist_east combination
+        # Create one row for each ID, dist_east, relative_position combination
         .explode("matches")
         .unnest("matches"))
-    # Based on which observation has the maximum dist_east, set its relative position
-    uncertain = uncertain.with_columns(relative_position=pl.when(pl.col("dist_east") == pl.col("max_dist_east"))
-                                       .then(pl.lit("Back"))
-                                       .otherwise(pl.lit("Front").cast(Relative_Position)))
-    # Drop unnecessary column, as it was used to find the relative position
-    uncertain = uncertain.drop("max_dist_east")
     uncertain = uncertain.sort("crossing_time")
-    # Join the uncertain trajectories into the observations by ensuring the relative position matches
-    uncertain = uncertain.join_asof(observations,
+    # Join the uncertain trajectories into the observations by ensuring the relative position matches.
+    # Both sides are already sorted by time, so skip checking it again.
+    uncertain = uncertain.join_asof(observations.lazy().set_sorted("observation_time"),
                                     left_on="crossing_time", right_on="observation_time",
-                                    by=["direction", "relative_position"],
-                                    tolerance=datetime.timedelta(seconds=1))
+                                    by=["direction", "relative_position"], strategy="backward",
+                                    tolerance=datetime.timedelta(seconds=1), check_sortedness=False)
+    uncertain = uncertain.with_columns(is_matched=pl.col("observation_time").is_not_null()).collect()
     # Return the crossings which were matched and the ones that were not matched
-    return (uncertain.filter(pl.col("observation_time").is_not_null()),
-            uncertain.filter(pl.col("observation_time").is_null()))
+    partitions = uncertain.partition_by("is_matched", as_dict=True, include_key=False)
+    empty = uncertain.clear().drop("is_matched")
+    return partitions.get((True,), empty), partitions.get((False,), empty)
+
+
+@njit("float64(int64[:], int64[:], int64)", cache=True)
+def _mean_bounded_difference(lhs: np.ndarray, rhs: np.ndarray, bound: int) -> float:
+    """
+    Calculates the mean of the differences ``lhs - rhs`` that are smaller than the bound in absolute value.
+    :return: The mean difference, or NaN if no difference is within the bound.
+    """
+    total = 0
+    n = 0
+    for i in range(lhs.size):
+        difference = lhs[i] - rhs[i]
+        if -bound < difference < bound:
+            total += difference
+            n += 1
+    if n == 0:
+        return np.nan
+    return total / n
 
 
 def find_skewness_factor(sorted_observations: pl.DataFrame, sorted_crossing_points: pl.DataFrame) -> float:
@@ -61,22 +82,123 @@ def find_skewness_factor(sorted_observations: pl.DataFrame, sorted_crossing_poin
     :return: Factor to add to observations so they are closer to the crossing times
     """
     # factor = mean (crossing_time - observation_time)
-    if (sorted_observations.select(pl.col("observation_time").len()).item()
-            != sorted_crossing_points.select(pl.col("crossing_time").len()).item()):
+    if sorted_observations.height != sorted_crossing_points.height:
         raise ValueError("The number of crossing points does not match the number of observations")
     # Keep only the time from the datetime objects
     sorted_observations = sorted_observations.with_columns(pl.col("observation_time").dt.time())
     crossing_points = sorted_crossing_points.sort("crossing_time").with_columns(pl.col("crossing_time").dt.time())
-    factor = crossing_points.select(pl.col("crossing_time")).to_series() - sorted_observations.select(
-        pl.col("observation_time")).to_series()
-    # Keep only the absolute difference
-    factor = factor.filter(
-        factor.map_elements(lambda x: abs(x.total_seconds()), return_dtype=pl.Int64) < 10
-    )
+    # Times are stored as nanoseconds since midnight, pairs with a missing time have no difference
+    times = pl.DataFrame({"crossing_time": crossing_points.get_column("crossing_time"),
+                          "observation_time": sorted_observations.get_column("observation_time")}).drop_nulls()
+    # Keep only differences smaller than 10 seconds in absolute value
+    factor = _mean_bounded_difference(times.get_column("crossing_time").to_physical().to_numpy(writable=True),
+                                      times.get_column("observation_time").to_physical().to_numpy(writable=True),
+                                      10_000_000_000)
     # if factor.max().dt.total_seconds() > 5:
     #     print("WARNING: skewness calculated with a factor of more than 5 seconds, this usually indicates an"
     #           "error in the provided sampels")
-    return factor.mean()
+    if np.isnan(factor):
+        return None
+    return pl.Series([int(factor)], dtype=pl.Duration("ns")).item()
+
+
+# Manually matched observation and crossing times for period and direction combinations, where there are errors in
+# the first or last crossings.
+# Day, Hour, Direction: [(Observation, Crossing)]
+_MANUAL_MATCHES_ISO = {
+    (1, 6, "Southbound"): [
+        # Observation, Crossing
+        # Start
+        ("2024-10-01T06:45:32.565000+0200", "2024-10-01T06:45:33.640000+0200"),
+        ("2024-10-01T06:45:50.717000+0200", "2024-10-01T06:45:51.880000+0200"),
+        ("2024-10-01T06:46:39.232000+0200", "2024-10-01T06:46:40.360000+0200"),
+        ("2024-10-01T06:48:27.807000+0200", "2024-10-01T06:48:28.840000+0200"),
+        ("2024-10-01T06:49:26.031000+0200", "2024-10-01T06:49:27.000000+0200"),
+        # End
+        ("2024-10-01T09:02:38.047000+0200", "2024-10-01T09:02:39.000000+0200"),
+        ("2024-10-01T09:02:39.148000+0200", "2024-10-01T09:02:40.120000+0200"),
+        ("2024-10-01T09:02:50.693000+0200", "2024-10-01T09:02:51.720000+0200"),
+        ("2024-10-01T09:03:36.405000+0200", "2024-10-01T09:03:37.400000+0200"),
+        ("2024-10-01T09:04:43.272000+0200", "2024-10-01T09:04:44.280000+0200")
+    ],
+    (1, 16, "Southbound"): [
+        # Observation, Crossing
+        # Start
+        ("2024-10-01T16:00:02.502000+0200", "2024-10-01T16:00:05.320000+0200"),
+        ("2024-10-01T16:00:06.072000+0200", "2024-10-01T16:00:08.920000+0200"),
+        ("2024-10-01T16:00:33.533000+0200", "2024-10-01T16:00:36.360000+0200"),
+        ("2024-10-01T16:00:34.467000+0200", "2024-10-01T16:00:37.240000+0200"),
+        ("2024-10-01T16:00:36.236000+0200", "2024-10-01T16:00:39.080000+0200"),
+        # End
+        ("2024-10-01T18:19:11.473000+0200", "2024-10-01T18:19:14.360000+0200"),
+        ("2024-10-01T18:19:16.945000+0200", "2024-10-01T18:19:19.800000+0200"),
+        ("2024-10-01T18:19:18.714000+0200", "2024-10-01T18:19:21.560000+0200"),
+        ("2024-10-01T18:19:39.201000+0200", "2024-10-01T18:19:42.040000+0200"),
+        ("2024-10-01T18:19:41.236000+0200", "2024-10-01T18:19:44.120000+0200")
+    ],
+    (2, 16, "Northbound"): [
+        # Observation, Crossing
+        # Start
+        ("2024-10-02T16:00:16.916000+0200", "2024-10-02 16:00:18.520000+02:00"),
+        ("2024-10-02T16:00:48.748000+0200", "2024-10-02 16:00:50.360000+02:00"),
+        ("2024-10-02T16:00:49.916000+0200", "2024-10-02 16:00:51.480000+02:00"),
+        ("2024-10-02T16:00:54.187000+0200", "2024-10-02 16:00:55.800000+02:00"),
+        ("2024-10-02T16:01:33.793000+0200", "2024-10-02 16:01:35.320000+02:00"),
+        # End
+        ("2024-10-02T18:18:40.242000+0200", "2024-10-02 18:18:41.800000+02:00"),
+        ("2024-10-02T18:18:59.561000+0200", "2024-10-02 18:19:01.160000+02:00"),
+        ("2024-10-02T18:19:19.314000+0200", "2024-10-02 18:19:20.920000+02:00"),
+        ("2024-10-02T18:19:24.053000+0200", "2024-10-02 18:19:25.640000+02:00"),
+        ("2024-10-02T18:19:27.656000+0200", "2024-10-02 18:19:29.240000+02:00")
+    ],
+    (3, 16, "Northbound"): [
+        # Observation, Crossing
+        # Start
+        ("2024-10-03T16:00:36.936000+0200", "2024-10-03T16:00:39.080000+0200"),
+        ("2024-10-03T16:00:44.711000+0200", "2024-10-03T16:00:46.840000+0200"),
+        ("2024-10-03T16:01:21.014000+0200", "2024-10-03 16:01:23.080000+02:00"),
+        ("2024-10-03T16:01:34.027000+0200", "2024-10-03 16:01:36.040000+02:00"),
+        ("2024-10-03T16:01:51.044000+0200", "2024-10-03T16:01:53.160000+0200"),
+        # End
+        ("2024-10-03T18:17:56.165000+0200", "2024-10-03 18:17:58.280000+02:00"),
+        ("2024-10-03T18:18:19.688000+0200", "2024-10-03 18:18:21.800000+02:00"),
+        ("2024-10-03T18:18:29.164000+0200", "2024-10-03 18:18:31.240000+02:00"),
+        ("2024-10-03T18:19:11.974000+0200", "2024-10-03 18:19:14.040000+02:00"),
+        ("2024-10-03T18:19:55.551000+0200", "2024-10-03 18:19:57.720000+02:00")
+    ],
+    (3, 16, "Southbound"): [
+        # Observation, Crossing
+        # Start
+        ("2024-10-03T16:00:00.079000+0200", "2024-10-03T16:00:03.080000+0200"),
+        ("2024-10-03T16:00:12.512000+0200", "2024-10-03T16:00:15.560000+0200"),
+        ("2024-10-03T16:00:15.215000+0200", "2024-10-03T16:00:18.200000+0200"),
+        ("2024-10-03T16:00:16.382000+0200", "2024-10-03T16:00:19.480000+0200"),
+        ("2024-10-03T16:00:23.156000+0200", "2024-10-03T16:00:26.280000+0200"),
+        # End
+        ("2024-10-03T18:19:43.872000+0200", "2024-10-03T18:19:45.960000+0200"),
+        ("2024-10-03T18:19:44.540000+0200", "2024-10-03T18:19:46.680000+0200"),
+        ("2024-10-03T18:19:46.341000+0200", "2024-10-03T18:19:48.520000+0200"),
+        ("2024-10-03T18:19:47.309000+0200", "2024-10-03T18:19:49.480000+0200"),
+        ("2024-10-03T18:19:56.785000+0200", "2024-10-03T18:19:58.920000+0200")
+    ]
+}
+# Parse the manual matches once into lists of observation and crossing times
+_MANUAL_MATCHES = {
+    key: ([datetime.datetime.fromisoformat(p[0]) for p in pairs],
+          [datetime.datetime.fromisoformat(p[1]) for p in pairs])
+    for key, pairs in _MANUAL_MATCHES_ISO.items() if len(pairs) != 0
+}
+
+# For which times to perform linear compensation
+_LINEAR_COMPENSATION = {
+    # Day, Hour, Direction
+    (2, 6, "Northbound"),
+    (3, 6, "Northbound"),
+    (3, 16, "Southbound")
+}
+
+# Crossings are counted in a period up to this long after its end
+_END_ADJUSTMENT = timedelta(seconds=2)
 
 
 def correct_skewness(observations: pl.DataFrame, crossing_points: pl.DataFrame,
@@ -106,156 +228,65 @@ def correct_skewness(observations: pl.DataFrame, crossing_points: pl.DataFrame,
     :return: ``observations`` dataframe with skewness factors applied and sorted by ``observation_time``.
     """
 
-    manual_matches = {
-        1: {
-            6: {
-                "Southbound": [
-                    # Observation, Crossing
-                    # Start
-                    ("2024-10-01T06:45:32.565000+0200", "2024-10-01T06:45:33.640000+0200"),
-                    ("2024-10-01T06:45:50.717000+0200", "2024-10-01T06:45:51.880000+0200"),
-                    ("2024-10-01T06:46:39.232000+0200", "2024-10-01T06:46:40.360000+0200"),
-                    ("2024-10-01T06:48:27.807000+0200", "2024-10-01T06:48:28.840000+0200"),
-                    ("2024-10-01T06:49:26.031000+0200", "2024-10-01T06:49:27.000000+0200"),
-                    # End
-                    ("2024-10-01T09:02:38.047000+0200", "2024-10-01T09:02:39.000000+0200"),
-                    ("2024-10-01T09:02:39.148000+0200", "2024-10-01T09:02:40.120000+0200"),
-                    ("2024-10-01T09:02:50.693000+0200", "2024-10-01T09:02:51.720000+0200"),
-                    ("2024-10-01T09:03:36.405000+0200", "2024-10-01T09:03:37.400000+0200"),
-                    ("2024-10-01T09:04:43.272000+0200", "2024-10-01T09:04:44.280000+0200")
-                ]
-            },
-            16: {
-                "Southbound": [
-                    # Observation, Crossing
-                    # Start
-                    ("2024-10-01T16:00:02.502000+0200", "2024-10-01T16:00:05.320000+0200"),
-                    ("2024-10-01T16:00:06.072000+0200", "2024-10-01T16:00:08.920000+0200"),
-                    ("2024-10-01T16:00:33.533000+0200", "2024-10-01T16:00:36.360000+0200"),
-                    ("2024-10-01T16:00:34.467000+0200", "2024-10-01T16:00:37.240000+0200"),
-                    ("2024-10-01T16:00:36.236000+0200", "2024-10-01T16:00:39.080000+0200"),
-                    # End
-                    ("2024-10-01T18:19:11.473000+0200", "2024-10-01T18:19:14.360000+0200"),
-                    ("2024-10-01T18:19:16.945000+0200", "2024-10-01T18:19:19.800000+0200"),
-                    ("2024-10-01T18:19:18.714000+0200", "2024-10-01T18:19:21.560000+0200"),
-                    ("2024-10-01T18:19:39.201000+0200", "2024-10-01T18:19:42.040000+0200"),
-                    ("2024-10-01T18:19:41.236000+0200", "2024-10-01T18:19:44.120000+0200")
-                ]
-            }
-        },
-        2: {
-            16: {
-                "Northbound": [
-                    # Observation, Crossing
-                    # Start
-                    ("2024-10-02T16:00:16.916000+0200", "2024-10-02 16:00:18.520000+02:00"),
-                    ("2024-10-02T16:00:48.748000+0200", "2024-10-02 16:00:50.360000+02:00"),
-                    ("2024-10-02T16:00:49.916000+0200", "2024-10-02 16:00:51.480000+02:00"),
-                    ("2024-10-02T16:00:54.187000+0200", "2024-10-02 16:00:55.800000+02:00"),
-                    ("2024-10-02T16:01:33.793000+0200", "2024-10-02 16:01:35.320000+02:00"),
-                    # End
-                    ("2024-10-02T18:18:40.242000+0200", "2024-10-02 18:18:41.800000+02:00"),
-                    ("2024-10-02T18:18:59.561000+0200", "2024-10-02 18:19:01.160000+02:00"),
-                    ("2024-10-02T18:19:19.314000+0200", "2024-10-02 18:19:20.920000+02:00"),
-                    ("2024-10-02T18:19:24.053000+0200", "2024-10-02 18:19:25.640000+02:00"),
-                    ("2024-10-02T18:19:27.656000+0200", "2024-10-02 18:19:29.240000+02:00")
-                ]
-            }
-        },
-        3: {
-            16: {
-                "Northbound": [
-                    # Observation, Crossing
-                    # Start
-                    ("2024-10-03T16:00:36.936000+0200", "2024-10-03T16:00:39.080000+0200"),
-                    ("2024-10-03T16:00:44.711000+0200", "2024-10-03T16:00:46.840000+0200"),
-                    ("2024-10-03T16:01:21.014000+0200", "2024-10-03 16:01:23.080000+02:00"),
-                    ("2024-10-03T16:01:34.027000+0200", "2024-10-03 16:01:36.040000+02:00"),
-                    ("2024-10-03T16:01:51.044000+0200", "2024-10-03T16:01:53.160000+0200"),
-                    # End
-                    ("2024-10-03T18:17:56.165000+0200", "2024-10-03 18:17:58.280000+02:00"),
-                    ("2024-10-03T18:18:19.688000+0200", "2024-10-03 18:18:21.800000+02:00"),
-                    ("2024-10-03T18:18:29.164000+0200", "2024-10-03 18:18:31.240000+02:00"),
-                    ("2024-10-03T18:19:11.974000+0200", "2024-10-03 18:19:14.040000+02:00"),
-                    ("2024-10-03T18:19:55.551000+0200", "2024-10-03 18:19:57.720000+02:00")
-                ],
-                "Southbound": [
-                    # Observation, Crossing
-                    # Start
-                    ("2024-10-03T16:00:00.079000+0200", "2024-10-03T16:00:03.080000+0200"),
-                    ("2024-10-03T16:00:12.512000+0200", "2024-10-03T16:00:15.560000+0200"),
-                    ("2024-10-03T16:00:15.215000+0200", "2024-10-03T16:00:18.200000+0200"),
-                    ("2024-10-03T16:00:16.382000+0200", "2024-10-03T16:00:19.480000+0200"),
-                    ("2024-10-03T16:00:23.156000+0200", "2024-10-03T16:00:26.280000+0200"),
-                    # End
-                    ("2024-10-03T18:19:43.872000+0200", "2024-10-03T18:19:45.960000+0200"),
-                    ("2024-10-03T18:19:44.540000+0200", "2024-10-03T18:19:46.680000+0200"),
-                    ("2024-10-03T18:19:46.341000+0200", "2024-10-03T18:19:48.520000+0200"),
-                    ("2024-10-03T18:19:47.309000+0200", "2024-10-03T18:19:49.480000+0200"),
-                    ("2024-10-03T18:19:56.785000+0200", "2024-10-03T18:19:58.920000+0200")
-                ]
-            }
-        }
-    }
-
-    # For which times to perform linear compensation
-    linear_compensation = {
-        # Day, Hour, Direction
-        (2, 6, "Northbound"),
-        (3, 6, "Northbound"),
-        (3, 16, "Southbound")
-    }
-
-    # Apply the skewness factor for each period and direction combination
-    for period in periods:
+    # Tag each observation and crossing with the index of its period once, and split them by period and direction in a
+    # single pass, instead of filtering the whole dataframes for every combination.
+    observation_period = pl.coalesce(
+        [pl.when(pl.col("observation_time").is_between(start, end)).then(pl.lit(i))
+         for i, (start, end) in enumerate(periods)]).alias("period_id")
+    crossing_period = pl.coalesce(
+        [pl.when(pl.col("crossing_time").is_between(start, end + _END_ADJUSTMENT)).then(pl.lit(i))
+         for i, (start, end) in enumerate(periods)]).alias("period_id")
+    observations = observations.with_columns(observation_period)
+    observations_by_period = observations.partition_by("period_id", "direction", as_dict=True)
+    crossings_by_period = crossing_points.with_columns(crossing_period).partition_by("period_id", "direction",
+                                                                                    as_dict=True)
+
+    # Skewness factor for each period and direction combination, applied to all observations at the end
+    factors = []
+    # Period and direction combinations with linear compensation, along with their samples
+    linear_compensations = []
+    for i, period in enumerate(periods):
+        day, hour = period[0].day, period[0].hour
         for direction in ("Northbound", "Southbound"):
-            # Keep only observations and crossings in this period
-
-            end_adjustment = timedelta(seconds=2)
-
-            observation_in_period = (pl.col("observation_time").is_between(period[0], period[1]) &
-                                     (pl.col("direction") == direction))
-            crossing_in_period = (pl.col("crossing_time").is_between(period[0], period[1] + end_adjustment) &
-                                  (pl.col("direction") == direction))
-
             period_observations = None
             period_crossings = None
 
             # If the trajectories and observations have been manually entered
-            # Jank
-            if period[0].hour in manual_matches[period[0].day].keys():
-                if direction in manual_matches[period[0].day][period[0].hour].keys():
-                    pairs = manual_matches[period[0].day][period[0].hour][direction]
-                    if len(pairs) != 0:
-                        # Calculate using manual entries
-                        period_observations = pl.DataFrame(
-                            {"observation_time": [datetime.datetime.fromisoformat(p[0]) for p in pairs]})
-                        period_crossings = pl.DataFrame({"crossing_time":
-                                                             [datetime.datetime.fromisoformat(p[1]) for p in pairs]})
+            key = (day, hour, direction)
+            if key in _MANUAL_MATCHES:
+                # Calculate using manual entries
+                manual_observations, manual_crossings = _MANUAL_MATCHES[key]
+                period_observations = pl.DataFrame({"observation_time": manual_observations})
+                period_crossings = pl.DataFrame({"crossing_time": manual_crossings})
             # If no manual entries exist, take some samples
             if period_observations is None:
-                period_observations = observations.filter(observation_in_period)
-                period_crossing_points = crossing_points.filter(crossing_in_period)
+                period_observations = observations_by_period.get((i, direction), observations.clear())
+                period_crossing_points = crossings_by_period.get((i, direction), crossing_points.clear())
                 # Sample the first and last observations
-                period_observations = pl.concat(
-                    [period_observations.head(samples_start), period_observations.tail(samples_end)]
-                )
-                period_crossings = pl.concat(
-                    [period_crossing_points.head(samples_start), period_crossing_points.tail(samples_end)]
-                )
-
-            if (period[0].day, period[0].hour, direction) in linear_compensation:
-                observations = apply_linear_compensation(observations, crossing_points, period, direction,
-                                                         sample_observations=period_observations,
-                                                         sample_crossings=period_crossings)
+                period_observations = _sample_start_end(period_observations, samples_start, samples_end)
+                period_crossings = _sample_start_end(period_crossing_points, samples_start, samples_end)
+
+            if key in _LINEAR_COMPENSATION:
+                linear_compensations.append((i, period, direction, period_observations, period_crossings))
             else:
-                period_factor = find_skewness_factor(period_observations, period_crossings)
+                factors.append((i, direction, find_skewness_factor(period_observations, period_crossings)))
+
+    # Apply the factors only to observations within their period and direction, together with the linear compensations
+    # in a single update of the observation times
+    factors = pl.DataFrame(factors, schema={"period_id": observations.schema["period_id"],
+                                            "direction": observations.schema["direction"],
+                                            "skewness_factor": pl.Duration("us")}, orient="row")
+    observations = observations.join(factors, on=["period_id", "direction"], how="left", maintain_order="left")
+    # Reuse the period of each observation instead of checking the period bounds again
+    compensations = [_linear_compensation(observations, crossing_points, period, direction,
+                                          sample_observations=period_observations, sample_crossings=period_crossings,
+                                          observation_in_period=(pl.col("period_id") == i) &
+                                                                (pl.col("direction") == direction))
+                     for i, period, direction, period_observations, period_crossings in linear_compensations]
+    observations = observations.with_columns(
+        pl.col("observation_time") + pl.coalesce("skewness_factor", *compensations).fill_null(timedelta(0))
+    ).drop("period_id", "skewness_factor")
 
-                # Apply the factor only to observations within the period
-                observations = observations.with_columns(
-                    pl.when(observation_in_period).
-                    then(pl.col("observation_time") + period_factor).
-                    otherwise("observation_time"))
     # Sort again by time
     return observations.sort("observation_time")
 
@@ -282,44 +313,57 @@ def apply_linear_compensation(observations: pl.DataFrame, crossings: pl.DataFram
     :return: ``observations`` dataframe with changes only to the times of observations specified by the period and
     direction.
     """
-    observation_in_period = (pl.col("observation_time").is_between(period[0], period[1]) &
-                             (pl.col("direction") == direction))
+    compensation = _linear_compensation(observations, crossings, period, direction, sample_observations,
+                                        sample_crossings)
+    return observations.with_columns(pl.col("observation_time") + compensation.fill_null(timedelta(0)))
+
+
+def _linear_compensation(observations: pl.DataFrame, crossings: pl.DataFrame,
+                         period: tuple[datetime.datetime, datetime.datetime], direction,
+                         sample_observations: pl.DataFrame = None,
+                         sample_crossings: pl.DataFrame = None,
+                         observation_in_period: pl.Expr = None) -> pl.Expr:
+    """
+    Calculates the linear compensation for observation times in the given period and direction combination.
+    See :func:`apply_linear_compensation` for the rest of the parameters.
+    :param observation_in_period: Boolean expression selecting the observations in the period and direction, if it is
+    already known.
+    :return: Expression with the duration to add to each observation time, null for observations outside the period
+    and direction.
+    """
+    if observation_in_period is None:
+        observation_in_period = (pl.col("observation_time").is_between(period[0], period[1]) &
+                                 (pl.col("direction") == direction))
     crossing_in_period = (pl.col("crossing_time").is_between(period[0], period[1]) &
                           (pl.col("direction") == direction))
 
     # If no samples are provided, take some
     if sample_observations is None:
-        sample_observations = pl.concat([observations.filter(observation_in_period).head(5),
-                                         observations.filter(observation_in_period).tail(5)])
+        period_observations = observations.filter(observation_in_period)
+        sample_observations = _sample_start_end(period_observations, 5, 5)
     if sample_crossings is None:
-        sample_crossings = pl.concat([crossings.filter(crossing_in_period).head(5),
-                                      crossings.filter(crossing_in_period).tail(5)])
+        period_crossings = crossings.filter(crossing_in_period)
+        sample_crossings = _sample_start_end(period_crossings, 5, 5)
 
     # Calculate the drift at the start
-    factor_start = (sample_crossings.select(pl.col("crossing_time").head(5)).to_series() -
-                    sample_observations.select(pl.col("observation_time").head(5)).to_series()).to_numpy().mean()
+    crossing_times = sample_crossings["crossing_time"]
+    observation_times = sample_observations["observation_time"]
+    factor_start = (crossing_times.head(5) - observation_times.head(5)).mean()
 
     # Add the factor to all observations within the period, so there is a common starting point
-    observations = observations.with_columns(pl.when(observation_in_period)
-                                             .then(pl.col("observation_time") + factor_start)
-                                             .otherwise(pl.col("observation_time")))
-
-    # Add the factor to the sample observations, to calculate the drift at the end of the period
-    sample_observations = sample_observations.with_columns(pl.col("observation_time") + factor_start)
+    shifted_time = pl.col("observation_time") + factor_start
 
-    # Calculate the drift at the end of the period
-    offset_max = (sample_crossings.select(pl.col("crossing_time").tail(5)).to_series() -
-                  sample_observations.select(pl.col("observation_time").tail(5)).to_series()).to_numpy().mean()
+    # Calculate the drift at the end of the period, after adding the factor to the sample observations
+    offset_max = (crossing_times.tail(5) - observation_times.tail(5) - factor_start).mean()
 
     period_total_seconds = (period[1] - period[0]).total_seconds()
-    seconds_since_start = (pl.col("observation_time") - period[0]).dt.total_seconds().cast(pl.Float64)
-
-    observations = observations.with_columns(
-        pl.when(observation_in_period)
-        .then(pl.col("observation_time") + seconds_since_start / period_total_seconds * offset_max)
-        .otherwise("observation_time"))
+    seconds_since_start = (shifted_time - period[0]).dt.total_seconds().cast(pl.Float64)
+    # The drift is added to the shifted observations that are still within the period
+    shifted_in_period = shifted_time.is_between(period[0], period[1]) & (pl.col("direction") == direction)
+    drift = (pl.when(shifted_in_period).then(seconds_since_start / period_total_seconds * offset_max)
+             .otherwise(pl.lit(timedelta(0))))
 
-    return observations
+    return pl.when(observation_in_period).then(drift + factor_start)
 
 
 def fix_relative_position(matched_observations: pl.DataFrame) -> pl.DataFrame:
@@ -340,47 +384,62 @@ def fix_relative_position(matched_observations: pl.DataFrame) -> pl.DataFrame:
     with_relative_position = with_relative_position.with_columns(dist_east=null_replacement)
     # Columns relative to the observation and crossings
     crossing_columns = ["ID", "dist_east", "crossing_time"]
-    observation_columns = [col for col in with_relative_position.columns if col not in crossing_columns]
-    # Copy the observation_time column to use it in the groupby
-    with_relative_position = with_relative_position.with_columns(pl.col("observation_time").alias("observation_time_gb"),
-                                                                 pl.col("direction").alias("direction_gb"))
-    
-    # Group in 1s intervals
+    # The direction is a group key, so it is kept for each group without being collected into a list
+    observation_columns = [col for col in with_relative_position.columns if col not in crossing_columns + ["direction"]]
+    # Group in 1s intervals, starting from the first observation in each direction.
+    # Number the intervals with an integer, so that a plain group by can be used instead of a dynamic one.
+    time_bucket = ((pl.col("observation_time") - pl.col("observation_time").min().over("direction"))
+                   .dt.total_microseconds() // 1_000_000).alias("time_bucket")
+
     # Sort the dist_east and relative_position columns in each group independently, in the end they should match
     # to the actual positions, since front observations have low dist_east and back observations have high dist_east
-    with_relative_position = (with_relative_position.group_by_dynamic(index_column="observation_time_gb",
-                                                                      group_by="direction_gb",
-                                                                     every="1s",
-                                                                     start_by="datapoint")
+    with_relative_position = (with_relative_position.group_by("direction", time_bucket)
     # First sort all the observation columns in the group by relative_position, so the observations on the front appear
     # at the top and the observations at the back apper at the bottom. Preserve order in case of equality.
     # Then sort the crossing columns depending on dist_east, so that the observations are aligned.
                               .agg(pl.col(observation_columns).sort_by("relative_position", maintain_order=True),
-                                   pl.col(crossing_columns).sort_by("dist_east")).drop("observation_time_gb",
-                                                                                        "direction_gb")
-                              .explode(pl.all()))
+                                   pl.col(crossing_columns).sort_by("dist_east")).drop("time_bucket")
+                              .explode(*observation_columns, *crossing_columns))
     # Remove the fake dist_east values
     with_relative_position = with_relative_position.with_columns(dist_east=pl.when(pl.col("ID").is_null()).then(
         None
     ).otherwise(pl.col("dist_east")))
-    # Integrate the changes back into the main dataframe
-    matched_observations = matched_observations.update(with_relative_position, on="index",
-                                                       how="left", include_nulls=True)
+    # Integrate the changes back into the main dataframe, writing them directly to their original rows
+    indices = with_relative_position.get_column("index")
+    matched_observations = matched_observations.with_columns(
+        matched_observations.get_column(col).clone().scatter(indices, with_relative_position.get_column(col))
+        for col in with_relative_position.columns if col != "index"
+    )
     return matched_observations.drop("index")
 
 
+def _sample_start_end(df: pl.DataFrame, samples_start: int, samples_end: int) -> pl.DataFrame:
+    """
+    Takes the first and last rows of the dataframe in a single gather, in the same way as concatenating its head and
+    tail.
+    :param samples_start: Number of rows from the start.
+    :param samples_end: Number of rows from the end.
+    """
+    n = df.height
+    indices = list(range(min(samples_start, n))) + list(range(max(n - samples_end, 0), n))
+    return df.select(pl.all().gather(indices))
+
+
 def filter_period_observations(observations: pl.DataFrame, periods: list[tuple[datetime, datetime]]) -> pl.DataFrame:
     """
     Keep only observations in any of the given periods.
     :param observations: List of observations.
     :param periods: List of tuples of (start_date, end_date)
-    :return: DataFrame containing only observations falling within one or more of the given periods
+    :return: DataFrame containing only observations falling within one or more of the given periods, sorted by
+    ``observation_time``.
     """
-    predicate = None
-    for period in periods:
-        if predicate is None:
-            predicate = pl.col("observation_time").is_between(period[0], period[1])
-        else:
-            predicate = predicate | pl.col("observation_time").is_between(period[0], period[1])
-    observations = observations.filter(predicate)
-    return observations
+    time_dtype = observations.schema["observation_time"]
+    periods = pl.DataFrame({"period_start": [p[0] for p in periods], "period_end": [p[1] for p in periods]},
+                           schema={"period_start": time_dtype, "period_end": time_dtype}).sort("period_start")
+    # The periods do not overlap, so the period containing each observation is the last one starting before it, as long
+    # as the observation is also before its end
+    observations = observations.sort("observation_time").join_asof(
+        periods, left_on="observation_time", right_on="period_start", strategy="backward"
+    )
+    observations = observations.filter(pl.col("observation_time") <= pl.col("period_end"))
+    return observations.drop("period_start", "period_end")
@@ -2,6 +2,8 @@
 Methods for matching trajectories based on graphs
 """
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import numpy as np
 import polars as pl
@@ -15,67 +17,93 @@ from thesis.processing.observation_matching.common import match_uncertain, corre
     filter_period_observations
 
 
+def _find_edges(observations: pl.DataFrame, crossings: pl.DataFrame, threshold: pl.Duration) -> pl.DataFrame:
+    """
+    Finds all possible observations for each crossing, which are the observations within the threshold of the crossing.
+    :param observations: Observations with ``observation_id`` column.
+    :param crossings: Non-null crossings with ``crossing_id`` column.
+    :return: DataFrame with a row for each edge, containing the ``crossing_id``, ``observation_id`` and time difference
+    ``diff`` columns.
+    """
+    # With the observations sorted by time, the observations of each crossing are a contiguous range, which is found
+    # with a binary search.
+    sorted_observations = observations.select("observation_id", "observation_time").sort("observation_time")
+    observation_times = sorted_observations.get_column("observation_time")
+    windows = crossings.select(window_start=pl.col("crossing_time") - threshold,
+                               window_end=pl.col("crossing_time") + threshold)
+    range_start = observation_times.search_sorted(windows.get_column("window_start"), side="left").to_numpy()
+    range_end = observation_times.search_sorted(windows.get_column("window_end"), side="right").to_numpy()
+    range_length = range_end - range_start
+    # One edge for each crossing and each position within its range
+    edge_crossings = np.repeat(np.arange(crossings.height), range_length)
+    edge_positions = (np.arange(range_length.sum()) - np.repeat(np.cumsum(range_length) - range_length, range_length)
+                      + np.repeat(range_start, range_length))
+    return pl.DataFrame({
+        "crossing_id": crossings.get_column("crossing_id").gather(edge_crossings),
+        "observation_id": sorted_observations.get_column("observation_id").gather(edge_positions),
+        "diff": observation_times.gather(edge_positions) - crossings.get_column("crossing_time").gather(edge_crossings)
+    })
+
+
 def graph_matching(observations: pl.DataFrame, crossings: pl.DataFrame,
-                   threshold: pl.Duration) -> pl.DataFrame:
+                   threshold: pl.Duration, by: Optional[list[str]] = None) -> pl.DataFrame:
     """
     Matches observations to crossings by finding the minimum cost matching in a bipartite graph.
+    :param by: If given, observations are only matched to crossings with the same values in these columns.
+    All groups are matched with a single solve, as the graph consists of separate components for each group.
     :return: Includes all observations, including those not matched to any trajectory.
     """
-    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
     observations = observations.with_row_index("observation_id")
 
     # Keep only non-null crossings
     crossings = crossings.filter(pl.col("crossing_time").is_not_null()).with_row_index("crossing_id")
 
-    n_crossings = crossings.select(pl.len()).item()
-    n_observations = observations.select(pl.len()).item()
-
-    def search(period: datetime.datetime):
-        """
-        Finds all observations within the threshold of the given period.
-        :return: List of structs containing the observation id and time difference.
-        """
-        period_start = period - threshold
-        period_end = period + threshold
-        return observations.filter(pl.col("observation_time").is_between(period_start, period_end)).select(
-            pl.struct("observation_id", (pl.col("observation_time") - period).alias("diff"))
-        ).to_series().to_list()
-
-    # Find all possible observations for each crossing
-    crossings_with_observations = crossings.with_columns(
-        matching_observations=pl.col("crossing_time").map_elements(
-            lambda time: search(time), return_dtype=pl.List(pl.Struct({
-                "observation_id": pl.Int64, "diff": pl.Duration
-            }))
+    n_crossings = crossings.height
+    n_observations = observations.height
+
+    if by is None:
+        crossings_with_observations = _find_edges(observations, crossings, threshold)
+    else:
+        # The IDs are numbered before splitting, so the edges of all groups fit in the same graph
+        observation_groups = observations.partition_by(by, as_dict=True)
+        crossing_groups = crossings.partition_by(by, as_dict=True)
+        crossings_with_observations = pl.concat(
+            [_find_edges(observation_groups[key], crossing_groups[key], threshold)
+             for key in observation_groups.keys() & crossing_groups.keys()]
+            + [_find_edges(observations.clear(), crossings.clear(), threshold)]
         )
-    ).explode("matching_observations").unnest("matching_observations")
     #  Keep only the absolute value of millisecond difference with each observation
     crossings_with_observations = crossings_with_observations.with_columns(
-        pl.col("diff").dt.total_milliseconds().cast(pl.Float64).abs()
+        pl.col("diff").dt.total_milliseconds().abs()
     )
     # Each row now contains an edge with a weight
-    # Create a matrix with n_crossings rows and n_observation columns
-    graph = np.full((n_crossings, n_observations), np.iinfo(np.int64).max)
-    # Create the edges on the graph
-    for row in crossings_with_observations.iter_rows(named=True):
-        crossing_id = row["crossing_id"]
-        observation_id = row["observation_id"]
-        weight = row["diff"]
-        if observation_id is not None:
-            graph[crossing_id, observation_id] = np.int64(weight)
-    row_ind, col_ind = linear_sum_assignment(graph)
-    # Remove any int_max edges that were used, as they are not part of the optimal solution.
-    for i, (row, col) in enumerate(zip(row_ind, col_ind)):
-        if graph[row, col] == np.iinfo(np.int64).max:
-            col_ind[i] = -1
-    # Create match dataframe, removing the maximum cost edges
+    edges = crossings_with_observations
+    crossing_ids = edges.get_column("crossing_id").to_numpy()
+    observation_ids = edges.get_column("observation_id").to_numpy()
+    # Add 1 to each weight, since every crossing is matched once this does not change the optimal matching, but keeps
+    # edges with 0 difference from being treated as missing.
+    weights = edges.get_column("diff").to_numpy() + 1
+    # Not every crossing can be matched to an observation, so connect each crossing to its own dummy observation with a
+    # weight higher than all real edges together. The matching then uses as many real edges as possible, and among
+    # those the ones with the lowest total weight.
+    dummy_weight = weights.sum() + 1
+    graph = csr_matrix(
+        (np.concatenate([weights, np.full(n_crossings, dummy_weight)]),
+         (np.concatenate([crossing_ids, np.arange(n_crossings)]),
+          np.concatenate([observation_ids, n_observations + np.arange(n_crossings)]))),
+        shape=(n_crossings, n_observations + n_crossings))
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    # Create match dataframe, removing the dummy observations
     matches = pl.DataFrame({
-        "crossing_id": row_ind,
-        "observation_id": col_ind,
-    }).filter(pl.col("observation_id") != -1)
+        "crossing_id": row_ind.astype(np.uint32),
+        "observation_id": col_ind.astype(np.uint32),
+    }).filter(pl.col("observation_id") < n_observations)
     # Add information about crossings to observations
     matches = observations.join(matches, how="left", on="observation_id").join(crossings, how="left", on="crossing_id")
-    matches = matches.drop("crossing_id", "observation_id", "direction_right")
+    duplicate_columns = {"direction", *(by or [])}
+    matches = matches.drop("crossing_id", "observation_id", *(f"{col}_right" for col in duplicate_columns))
     
     return matches
 
@@ -95,23 +123,23 @@ def _match_observations_graph(observations: pl.DataFrame, crossing_times: pl.Dat
 
     # At first match uncertain crossings using positional information
     matched_uncertain, _ = match_uncertain(crossing_times, observations)
-    matched_ids = matched_uncertain.select(pl.col("ID")).to_series()
+    matched_ids = matched_uncertain.get_column("ID")
 
     # Match the rest of the crossing times using just the times
     crossing_times = crossing_times.filter(~pl.col("ID").is_in(matched_ids))
 
-    matches = []
-    for period in periods:
-        for direction in ("Northbound", "Southbound"):
-            these_observations = observations.filter(pl.col("observation_time").is_between(period[0], period[1]),
-                                                     pl.col("direction") == direction)
-            these_crossings = crossing_times.filter(pl.col("crossing_time").is_between(period[0], period[1]),
-                                                    pl.col("direction") == direction)
-            matches.append(graph_matching(these_observations, these_crossings, threshold))
-    
-    matched_uncertain = matched_uncertain.select(matches[0].columns)
-    matches.append(matched_uncertain)
-    matches = pl.concat(matches)
+    # Match all periods and directions at once, only keeping observations and crossings inside a period
+    def period_id(time_column: str) -> pl.Expr:
+        return pl.coalesce(pl.when(pl.col(time_column).is_between(start, end)).then(i)
+                           for i, (start, end) in enumerate(periods)).alias("period_id")
+
+    observations = observations.with_columns(period_id("observation_time")).drop_nulls("period_id")
+    crossing_times = crossing_times.with_columns(period_id("crossing_time")).drop_nulls("period_id")
+    matches = graph_matching(observations, crossing_times, threshold, by=["period_id", "direction"])
+    matches = matches.drop("period_id")
+
+    matched_uncertain = matched_uncertain.select(matches.columns)
+    matches = pl.concat([matches, matched_uncertain])
     matches = matches.sort("observation_time")
     
     matches = fix_relative_position(matches)
@@ -173,8 +201,10 @@ def calculate_match_all(threshold: pl.Duration = pl.duration(seconds=2)) -> pl.D
     :param threshold: 
     :return: Dataframe containing all observations along with their matched trajectories, if available
     """
-    rk = calculate_match_riddarhuskajen(threshold)
-    rb_tue = calculate_match_riddarholmsbron_n_tue(threshold)
-    rb_wed = calculate_match_riddarholmsbron_n_wed(threshold)
+    # The locations are matched independently, and most of the work is done in Polars and scipy which release the GIL
+    match_functions = (calculate_match_riddarhuskajen, calculate_match_riddarholmsbron_n_tue,
+                       calculate_match_riddarholmsbron_n_wed)
+    with ThreadPoolExecutor(max_workers=len(match_functions)) as executor:
+        matches = list(executor.map(lambda match_function: match_function(threshold), match_functions))
     
-    return pl.concat([rk, rb_tue, rb_wed]).sort("observation_time").with_columns(pl.col("location").cast(Location))
+    return pl.concat(matches).sort("observation_time").with_columns(pl.col("location").cast(Location))
@@ -22,8 +22,8 @@ def fix_duplicates(matched_observations: pl.DataFrame, crossing_times: pl.DataFr
     duplicates = matched_observations.filter(pl.col("ID").is_duplicated(),
                                              pl.col("ID").is_not_null())
     prev_dup = -1
-    while duplicates.select(pl.len()).item() != prev_dup:
-        prev_dup = duplicates.select(pl.len()).item()
+    while duplicates.height != prev_dup:
+        prev_dup = duplicates.height
 
         # Get the crossing times which have not been matched
         remaining_crossing_times = (crossing_times.join(matched, on="ID", how="anti").
@@ -80,7 +80,7 @@ def match_observations_asof(observations: pl.DataFrame, crossing_times: pl.DataF
 
     # At first match uncertain crossings using positional information
     matched_uncertain, _ = match_uncertain(crossing_times, observations)
-    matched_ids = matched_uncertain.select(pl.col("ID")).to_series()
+    matched_ids = matched_uncertain.get_column("ID")
 
     # Match the rest of the crossing times using just the times
     crossing_times = crossing_times.filter(~pl.col("ID").is_in(matched_ids))
@@ -35,23 +35,33 @@ def calculate_centerline_curvature(rk: pl.LazyFrame) -> pl.LazyFrame:
     return center_trajectory
 
 
+def _gradient(values: pl.Expr) -> pl.Expr:
+    """
+    Calculates the gradient like ``np.gradient``, using central differences for the interior points and one-sided
+    differences at the ends.
+    :param values: Values ordered by time.
+    """
+    return (((values.shift(-1) - values.shift(1)) / 2)
+            .fill_null(values.diff())
+            .fill_null(values.shift(-1) - values))
+
+
 def calculate_curvature(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     """
     Calculates the curvature at each datapoint.
     :param trajectories: DataFrame with ``location``, ``ID``, ``time``, ``X`` and ``Y`` columns.
     :return: Input DataFrame with ``curvature`` column.
     """
-    curvature = trajectories.group_by("location", "ID").agg(
-        pl.col("time").sort(),
-        pl.col("X").sort_by("time").map_batches(np.gradient).alias("xd"),
-        pl.col("Y").sort_by("time").map_batches(np.gradient).alias("yd"),
-        pl.col("X").sort_by("time").map_batches(np.gradient).map_batches(np.gradient).alias("xdd"),
-        pl.col("Y").sort_by("time").map_batches(np.gradient).map_batches(np.gradient).alias("ydd")
-    ).explode("time", "xd", "yd", "xdd", "ydd")
-
-    trajectories = trajectories.join(curvature, how="left", on=["location", "time", "ID"])
+    def derivative(expr: pl.Expr) -> pl.Expr:
+        return expr.over("location", "ID", order_by="time")
+
     trajectories = trajectories.with_columns(
-        curvature=((pl.col("xd") * pl.col("ydd")) - (pl.col("yd") * pl.col("xdd")) /
+        derivative(_gradient(pl.col("X"))).alias("xd"),
+        derivative(_gradient(pl.col("Y"))).alias("yd"),
+        derivative(_gradient(_gradient(pl.col("X")))).alias("xdd"),
+        derivative(_gradient(_gradient(pl.col("Y")))).alias("ydd")
+    ).with_columns(
+        curvature=((pl.col("xd") * pl.col("ydd") - pl.col("yd") * pl.col("xdd")) /
                    (((pl.col("xd").pow(2)) + pl.col("yd").pow(2)).pow(1.5))),
     ).drop("xd", "xdd", "yd", "ydd")
 
@@ -108,6 +118,33 @@ def calculate_cuts_corner(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     return trajectories
 
 
+def _observations_in_crossings(crossings: pl.LazyFrame, trajectories: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Finds the observations of each crossing, which are the observations of the same trajectory between the start and
+    end time of the crossing, including both.
+    :param crossings: DataFrame with ``location``, ``ID``, ``crossing_start_time`` and ``crossing_end_time`` columns.
+    :param trajectories: DataFrame with ``location``, ``ID`` and ``time`` columns.
+    :return: DataFrame with a row for each crossing and each of its observations.
+    An observation at the end of one crossing and the start of the next is included in both.
+    """
+    # With the trajectories sorted, the observations of each crossing are a contiguous range of rows, from the first
+    # row at or after its start until the last row at or before its end.
+    trajectories = trajectories.sort("location", "ID", "time").with_row_index("row")
+    row_times = trajectories.select("location", "ID", "time", "row")
+    crossings = (crossings.sort("location", "ID", "crossing_start_time")
+                 .join_asof(row_times.rename({"row": "first_row"}), left_on="crossing_start_time", right_on="time",
+                            by=["location", "ID"], strategy="forward", check_sortedness=False)
+                 .drop("time")
+                 .sort("location", "ID", "crossing_end_time")
+                 .join_asof(row_times.rename({"row": "last_row"}), left_on="crossing_end_time", right_on="time",
+                            by=["location", "ID"], strategy="backward", check_sortedness=False)
+                 .drop("time"))
+    crossings = (crossings.with_columns(row=pl.int_ranges(pl.col("first_row"), pl.col("last_row") + 1,
+                                                          dtype=pl.UInt32))
+                 .explode("row").drop("first_row", "last_row"))
+    return crossings.join(trajectories.drop("location", "ID"), on="row", how="inner").drop("row")
+
+
 def calculate_crossings_into_opposite_lane(trajectories: pl.LazyFrame) -> pl.LazyFrame:
     crossings = trajectories.sort("time")
     crosses_from_east_to_west = (pl.col("lat_pos").shift(-1) < 0) & (pl.col("lat_pos") > 0)
@@ -141,11 +178,7 @@ def calculate_crossings_into_opposite_lane(trajectories: pl.LazyFrame) -> pl.Laz
     )).explode("crossing_start", "crossing_end", "crossing_start_time", "crossing_end_time")
     
     # Calculate the distance travelled by taking all the observations in between each crossing
-    crossings = crossings.join_where(trajectories.select("location", "ID", "dist", "time", "lat_pos"),
-                                     pl.col("location") == pl.col("location_right"),
-                                     pl.col("ID") == pl.col("ID_right"),
-                                     pl.col("time").is_between(pl.col("crossing_start_time"),
-                                                                           pl.col("crossing_end_time")))
+    crossings = _observations_in_crossings(crossings, trajectories.select("location", "ID", "dist", "time", "lat_pos"))
     crossings = crossings.group_by("location", "ID", "crossing_start", "crossing_end").agg(
         pl.col("dist").sum().round(1).alias("crossing_dist"),
         pl.col("lat_pos").max().round(2).alias("crossing_max_lat_pos"),
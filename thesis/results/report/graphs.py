@@ -14,10 +14,10 @@ _save_dir.mkdir(exist_ok=True)
 def riddarhuskajen(trajectories: pl.LazyFrame):
     """
     Save graphs for Riddarhuskajen.
+    :param trajectories: Trajectories at Riddarhuskajen.
     """
     location_dir = _save_dir / "riddarhuskajen"
     location_dir.mkdir(exist_ok=True)
-    trajectories = trajectories.filter(pl.col("location") == Location.RIDDARHUSKAJEN)
     # Split trajectories into peak and off-peak
     peak_type = pl.Enum(["Peak", "Off-peak"])
     trajectories = trajectories.with_columns(
@@ -58,10 +58,10 @@ def riddarhuskajen(trajectories: pl.LazyFrame):
 def riddarholmsbron_n(trajectories: pl.LazyFrame):
     """
     Save graphs for Riddarholmsbron N.
+    :param trajectories: Trajectories at Riddarholmsbron N.
     """
     location_dir = _save_dir / "riddarholmsbron_n"
     location_dir.mkdir(exist_ok=True)
-    trajectories = trajectories.filter(pl.col("location") == Location.RIDDARHOLMSBRON_N)
 
     following_long_dist_lat_dev(trajectories).save(location_dir / "following.png", scale_factor=4.0)
     overtake_histogram(trajectories).save(location_dir / "overtakes.svg")
@@ -106,15 +106,15 @@ def riddarholmsbron_n(trajectories: pl.LazyFrame):
         all_by_type.save(var_dir / "4_all_by_type.svg")
 
 
-def riddarholmsbron_s(trajectories: pl.LazyFrame):
+def riddarholmsbron_s(trajectories: pl.LazyFrame, trajectories_n: pl.LazyFrame):
     """
     Save graphs for Riddarholmsbron S.
+    :param trajectories: Trajectories at Riddarholmsbron S.
+    :param trajectories_n: Trajectories at Riddarholmsbron N, to compare meetings on both bridges.
     """
     location_dir = _save_dir / "riddarholmsbron_s"
     location_dir.mkdir(exist_ok=True)
-    meeting_distance_by_width(trajectories.filter(pl.col("location") !=
-                                                  Location.RIDDARHUSKAJEN)).save(location_dir / "meetings.svg")
-    trajectories = trajectories.filter(pl.col("location") == Location.RIDDARHOLMSBRON_S)
+    meeting_distance_by_width(pl.concat([trajectories_n, trajectories])).save(location_dir / "meetings.svg")
 
     following_long_dist_lat_dev(trajectories).save(location_dir / "following.png", scale_factor=4.0)
     overtake_histogram(trajectories).save(location_dir / "overtakes.svg")
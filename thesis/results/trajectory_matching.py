@@ -28,10 +28,10 @@ def matches_by_time_of_day(trajectories: pl.LazyFrame) -> pl.LazyFrame:
 
 
 def matches_by_time_of_day_and_type(location: Location) -> pl.LazyFrame:
-    trajectories = open_trajectories(location).lazy()
+    trajectories = open_trajectories(location)
     # Add summary information for time of day and match information
-    trajectories = add_summary_information(trajectories)
-    trajectories = add_matches(trajectories)
+    trajectories = add_summary_information(trajectories, columns=["time_of_day"])
+    trajectories = add_matches(trajectories, columns=["primary_type"])
 
     # Keep only matched trajectories
     trajectories = trajectories.filter(pl.col("ID").is_not_null(), pl.col("primary_type").is_not_null())
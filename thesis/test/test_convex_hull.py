@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+import polars as pl
+
+from thesis.processing.convex_hull import _monotone_chain, _qhull, calculate_convex_hull, _MONOTONE_CHAIN_MAX_POINTS
+
+
+class TestConvexHull(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_random_points(self):
+        for n_points in (3, 4, 10, _MONOTONE_CHAIN_MAX_POINTS, _MONOTONE_CHAIN_MAX_POINTS + 1, 2000):
+            points = self.rng.normal(size=(n_points, 2))
+            np.testing.assert_array_equal(_monotone_chain(points), _qhull(points))
+
+    def test_collinear_and_duplicate_points(self):
+        # Square with points on its edges, duplicate corners and points inside
+        corners = np.array([[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0]])
+        on_edges = np.array([[1.0, 0.0], [2.0, 1.0], [1.0, 2.0], [0.0, 1.0]])
+        inside = self.rng.uniform(0.1, 1.9, size=(40, 2))
+        points = np.concatenate([inside, corners, on_edges, corners])
+        hull = _monotone_chain(points)
+        np.testing.assert_array_equal(hull, _qhull(points))
+        np.testing.assert_array_equal(hull, corners)
+
+    def test_clockwise_triangle(self):
+        points = np.array([[0.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+        np.testing.assert_array_equal(_monotone_chain(points), _qhull(points))
+
+    def test_degenerate(self):
+        """
+        Qhull cannot calculate the hull of these points, so only the monotone chain is tested.
+        """
+        line = np.array([[2.0, 2.0], [0.0, 0.0], [1.0, 1.0], [3.0, 3.0]])
+        np.testing.assert_array_equal(_monotone_chain(line), [[0.0, 0.0], [3.0, 3.0]])
+        np.testing.assert_array_equal(_monotone_chain(np.array([[1.0, 1.0], [1.0, 1.0]])), [[1.0, 1.0]])
+        np.testing.assert_array_equal(_monotone_chain(np.array([[1.0, 2.0], [0.0, 5.0]])), [[0.0, 5.0], [1.0, 2.0]])
+
+    def test_calculate_convex_hull(self):
+        # One small group, handled by the monotone chain, and one large group, handled by Qhull
+        sizes = {0.0: 20, 0.5: _MONOTONE_CHAIN_MAX_POINTS + 100}
+        groups = {long_pos: self.rng.normal(size=(size, 2)) for long_pos, size in sizes.items()}
+        trajectories = pl.concat([
+            pl.DataFrame({"long_pos": long_pos, "lat_pos": 1.0, "in_path": True, "X": points[:, 0], "Y": points[:, 1]})
+            for long_pos, points in groups.items()
+        ])
+        result = calculate_convex_hull(trajectories).sort("long_pos")
+        for long_pos, hull in zip(result.get_column("long_pos"), result.get_column("hull")):
+            np.testing.assert_array_equal(hull.to_numpy(), _qhull(groups[long_pos]))
+
+
+if __name__ == '__main__':
+    unittest.main()
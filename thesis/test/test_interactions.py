@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from thesis.processing.interactions import calculate_following_meeting_ids
+from thesis.processing.interactions.following import calculate_following_parameters
+from thesis.processing.interactions.overtake import calculate_overtakes
+
+
+def _trajectory(trajectory_id: int, direction: str, start_second: int, positions: list[float]) -> list[tuple]:
+    start = datetime(2024, 10, 1, 7, 0, 0)
+    return [("A", trajectory_id, start + timedelta(seconds=start_second + i), direction, long_pos)
+            for i, long_pos in enumerate(positions)]
+
+
+class TestFollowingMeeting(unittest.TestCase):
+
+    def setUp(self):
+        # Bike 2 passes the positions of bike 1 two seconds later, while bike 3 comes from the opposite direction.
+        # Meetings look ahead in time, so bike 3 only meets bike 2, which passes its positions after it.
+        rows = (_trajectory(1, "Northbound", 0, [0.0, 0.5, 1.0]) +
+                _trajectory(2, "Northbound", 2, [0.0, 0.5, 1.0]) +
+                _trajectory(3, "Southbound", 3, [1.0, 0.5, 0.0]))
+        self.trajectories = pl.DataFrame(rows, schema=["location", "ID", "time", "direction", "long_pos"],
+                                         orient="row")
+
+    def test_following_meeting_ids(self):
+        result = calculate_following_meeting_ids(self.trajectories.lazy()).collect().sort("ID")
+        result = result.with_columns(pl.col("meeting_ids", "following_ids").list.sort())
+        self.assertListEqual(result.get_column("ID").to_list(), [1, 2, 3])
+        self.assertListEqual(result.get_column("meeting_ids").to_list(), [[3], [3], [2]])
+        self.assertListEqual(result.get_column("following_ids").to_list(), [[], [1], []])
+
+    def test_unused_columns(self):
+        trajectories = self.trajectories.with_columns(lat_pos=pl.lit(0.5), speed=pl.lit(4.0))
+        result = calculate_following_meeting_ids(trajectories.lazy()).collect()
+        self.assertListEqual(result.columns, ["location", "ID", "meeting_ids", "following_ids"])
+        self.assertEqual(result.height, 3)
+
+
+class TestFollowingParameters(unittest.TestCase):
+
+    def test_time_headway(self):
+        # Bike 2 passes the positions of bike 1 two seconds later
+        positions = [0.0, 0.5, 1.0, 1.5]
+        trajectories = pl.DataFrame(_trajectory(1, "Northbound", 0, positions) +
+                                    _trajectory(2, "Northbound", 2, positions),
+                                    schema=["location", "ID", "time", "direction", "long_pos"], orient="row")
+        trajectories = trajectories.with_columns(
+            following_ids=pl.when(pl.col("ID") == 2).then(pl.lit([1])).otherwise(pl.lit([], dtype=pl.List(pl.Int64))),
+            lat_pos=pl.when(pl.col("ID") == 1).then(0.5).otherwise(0.2),
+            speed=pl.lit(0.5),
+            in_path=pl.lit(True)
+        ).with_columns(X=pl.col("long_pos"), Y=pl.col("lat_pos"))
+        result = (calculate_following_parameters(trajectories.lazy()).collect()
+                  .explode("following_info").unnest("following_info").sort("time"))
+        self.assertListEqual(result.get_column("ID").to_list(), [2, 2])
+        self.assertListEqual(result.get_column("following_id").to_list(), [1, 1])
+        self.assertListEqual(result.get_column("following_time_headway").to_list(), [2000, 2000])
+        self.assertListEqual(result.get_column("following_long_dist").round(6).to_list(), [1.0, 1.0])
+
+
+class TestOvertakes(unittest.TestCase):
+
+    def test_overtake_far_apart(self):
+        # Bike 1 is first far behind bike 2 and passes it by the next datapoint
+        trajectories = pl.DataFrame(_trajectory(1, "Northbound", 0, [0.0, 30.0]) +
+                                    _trajectory(2, "Northbound", 0, [25.0, 26.0]),
+                                    schema=["location", "ID", "time", "direction", "long_pos"], orient="row")
+        result = calculate_overtakes(trajectories.lazy()).collect()
+        self.assertListEqual(result.get_column("ID").to_list(), [1])
+        self.assertListEqual(result.get_column("overtakes_id").to_list(), [[2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 
+import numpy as np
+
 from thesis.filtering.area_intersection import coords_intersect_polygon, points_are_counterclockwise
-from thesis.processing.crossing_times import line_intersection_index
+from thesis.processing.crossing_times import _crossing_points
 
 
 class TestAreaIntersection(unittest.TestCase):
@@ -30,36 +32,102 @@ class TestAreaIntersection(unittest.TestCase):
         p = [4.72, 2.38]
         self.assertTrue(coords_intersect_polygon(p[0], p[1], p1, p2, p3, p4))
 
+    def test_multiple_points(self):
+        p1 = [8.22, -5.02]
+        p2 = [22.02, -5.71]
+        p3 = [27.34, 3.05]
+        p4 = [3.03, 2.33]
+        x = [6.57, 4.72, 15.0]
+        y = [3.11, 2.38, 0.0]
+        self.assertListEqual(coords_intersect_polygon(x, y, p1, p2, p3, p4).tolist(), [False, True, True])
+
+
+class TestCrossingPoints(unittest.TestCase):
+    """
+    Tests the kernel finding the crossings of many trajectories at once.
+    """
+
+    l0 = [0.0, 0.0]
+    l1 = [0.0, 2.0]
+
+    def crossing_points(self, trajectories: list[list[tuple[float, float]]]) -> tuple[list, list]:
+        """
+        Runs the kernel for the given trajectories, with the time and dist_east of each point equal to its index.
+        :return: The time of the crossing for each trajectory and whether it was found.
+        """
+        offsets = np.cumsum([0] + [len(points) for points in trajectories]).astype(np.int64)
+        points = np.array([point for points in trajectories for point in points], dtype=np.float64).reshape(-1, 2)
+        time = np.concatenate([np.arange(len(points)) for points in trajectories]).astype(np.int64)
+        n = len(trajectories)
+        out_time = np.full(n, -1, dtype=np.int64)
+        out_dist_east = np.empty(n, dtype=np.float64)
+        out_found = np.empty(n, dtype=np.bool_)
+        _crossing_points(np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1]), time,
+                         time.astype(np.float64), offsets, np.tile(self.l0, (n, 1)), np.tile(self.l1, (n, 1)),
+                         out_time, out_dist_east, out_found)
+        self.assertListEqual(out_dist_east[out_found].tolist(), out_time[out_found].astype(np.float64).tolist())
+        return out_time.tolist(), out_found.tolist()
 
-class TestCrossing(unittest.TestCase):
+    def test_crossing(self):
+        times, found = self.crossing_points([[(-2.0, 1.0), (-1.0, 1.0), (1.0, 1.0), (2.0, 1.0)]])
+        self.assertListEqual(found, [True])
+        self.assertListEqual(times, [1])
 
-    def test_empty_x_y(self):
-        l0 = [1, 1]
-        l1 = [0, 0]
-        x = []
-        y = []
-        self.assertEqual(line_intersection_index(x, y, l0, l1), -1)
+    def test_touches_endpoint(self):
+        trajectories = [
+            # The first segment ends on the line
+            [(-1.0, 1.0), (0.0, 1.0), (1.0, 1.0)],
+            # Crosses through the end of the line
+            [(-1.0, 3.0), (1.0, 1.0)],
+            # Passes just outside the end of the line
+            [(-1.0, 3.5), (1.0, 2.5)],
+        ]
+        times, found = self.crossing_points(trajectories)
+        self.assertListEqual(found, [True, True, False])
+        self.assertListEqual(times[:2], [0, 0])
+
+    def test_parallel_and_collinear(self):
+        trajectories = [
+            [(1.0, 0.0), (1.0, 2.0), (1.0, 4.0)],
+            [(0.0, -1.0), (0.0, 3.0)],
+        ]
+        _, found = self.crossing_points(trajectories)
+        self.assertListEqual(found, [False, False])
+
+    def test_no_crossing(self):
+        trajectories = [
+            [(3.0, 1.0), (4.0, 1.0), (5.0, 2.0)],
+            [(3.0, 1.0)],
+            [],
+            [(-2.0, 1.0), (2.0, 1.0)],
+        ]
+        times, found = self.crossing_points(trajectories)
+        # Each trajectory is independent of the ones before it
+        self.assertListEqual(found, [False, False, False, True])
+        self.assertEqual(times[3], 0)
 
-    def test_intersection_first(self):
-        l0 = [-6, -1]
-        l1 = [-4, 1]
+    def test_empty(self):
+        times, found = self.crossing_points([[]])
+        self.assertListEqual(found, [False])
+        self.assertListEqual(times, [-1])
+
+    def test_intersection_first_and_last(self):
+        self.l0, self.l1 = [-6.0, -1.0], [-4.0, 1.0]
         x = [-5.22, -4.79, -3.98, -3.19]
         y = [0.35, -0.22, -0.58, -0.54]
-        self.assertEqual(line_intersection_index(x, y, l0, l1), 0)
-
-    def test_intersection_last(self):
-        l0 = [-6, -1]
-        l1 = [-4, 1]
-        x = [-3.19, -3.98, -4.79, -5.22]
-        y = [-0.54, -0.58, -0.22, 0.35]
-        self.assertEqual(line_intersection_index(x, y, l0, l1), 2)
-        
+        times, found = self.crossing_points([list(zip(x, y)), list(zip(x[::-1], y[::-1]))])
+        self.assertListEqual(found, [True, True])
+        self.assertListEqual(times, [0, 2])
+
     def test_intersection_middle(self):
-        l0 = [2.66, 7.04]
-        l1 = [-2.09, 4.96]
+        self.l0, self.l1 = [2.66, 7.04], [-2.09, 4.96]
         x = [-3.47, -3, -2.33, -1.59, -1.16, -0.95, 1.86, 3.84, 6.28]
         y = [10.96, 9.95, 8.41, 7.07, 5.93, 5.03, 4.73, 4.79, 4.83]
-        self.assertEqual(line_intersection_index(x, y, l0, l1), 4)
+        # In the reversed direction the same segment starts at the other point
+        times, found = self.crossing_points([list(zip(x, y)), list(zip(x[::-1], y[::-1]))])
+        self.assertListEqual(found, [True, True])
+        self.assertListEqual(times, [4, 3])
+
 
 class TestCounterclockwise(unittest.TestCase):
     
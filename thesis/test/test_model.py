@@ -12,4 +12,22 @@ class TestEnums(TestCase):
         unsorted = ["Back", "Front", "Front", "Back", "Front"]
         unsorted_series = pl.Series(unsorted, dtype=Relative_Position)
         sorted_series = unsorted_series.sort()
-        self.assertEqual(expected, sorted_series.to_list())
\ No newline at end of file
+        self.assertEqual(expected, sorted_series.to_list())
+
+class TestExprs(TestCase):
+
+    def test_time_of_day(self):
+        from datetime import datetime
+        from zoneinfo import ZoneInfo
+        from thesis.model.exprs import time_of_day_column, is_observed
+        tz = ZoneInfo("Europe/Stockholm")
+        times = pl.DataFrame({"time": [
+            datetime(2024, 10, 1, 6, 44, tzinfo=tz),
+            datetime(2024, 10, 1, 6, 45, tzinfo=tz),
+            datetime(2024, 10, 2, 12, 30, tzinfo=tz),
+            datetime(2024, 10, 3, 18, 20, tzinfo=tz),
+            datetime(2024, 10, 3, 18, 21, tzinfo=tz),
+        ]})
+        result = times.select(time_of_day_column("time"), is_observed("time").alias("observed"))
+        self.assertEqual(["other", "am", "between_peaks", "pm", "other"], result["time_of_day"].to_list())
+        self.assertEqual([False, True, True, True, False], result["observed"].to_list())
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from thesis.model.enums import Direction, Relative_Position
+from thesis.processing.observation_matching.graph import _match_observations_graph
+
+
+def _matching_fixture() -> tuple[pl.DataFrame, pl.DataFrame, list[tuple[datetime, datetime]]]:
+    """
+    Observations and crossings for two periods, with a different clock skew for each period and direction.
+    Observations are labelled in the ``obs`` column by the index of their period and direction, followed by their
+    index.
+    The Northbound observations of the second period drift, so they are corrected with linear compensation.
+    """
+    tz = ZoneInfo("Europe/Stockholm")
+    periods = [(datetime(2024, 10, 1, 7, 0, tzinfo=tz), datetime(2024, 10, 1, 7, 10, tzinfo=tz)),
+               (datetime(2024, 10, 2, 6, 45, tzinfo=tz), datetime(2024, 10, 2, 6, 55, tzinfo=tz))]
+    skews = [1.2, -0.8, 0.5, 2.0]
+    observations = []
+    crossings = []
+    for p, (start, _) in enumerate(periods):
+        for d, direction in enumerate(("Northbound", "Southbound")):
+            block = 2 * p + d
+            for k in range(12):
+                crossing_time = start + timedelta(seconds=20 + 40 * k + 3 * block)
+                jitter = ((7 * k) % 5 - 2) * 0.05
+                drift = 0.15 * k if (p, direction) == (1, "Northbound") else 0
+                crossings.append((100 * block + k, direction, crossing_time, 1.0))
+                observations.append((f"{block}-{k}", crossing_time - timedelta(seconds=skews[block] - jitter - drift),
+                                     direction, None))
+    start = periods[0][0]
+    # Two crossings at the same time, told apart by their relative position
+    crossings += [(50, "Northbound", start + timedelta(seconds=310), 0.5),
+                  (51, "Northbound", start + timedelta(seconds=310), 1.5)]
+    observations += [("front", start + timedelta(seconds=310 - 1.2 - 0.3), "Northbound", "Front"),
+                     ("back", start + timedelta(seconds=310 - 1.2 - 0.2), "Northbound", "Back")]
+    # Crossing without an observation and observation without a crossing
+    crossings.append((60, "Southbound", start + timedelta(seconds=290), 1.0))
+    observations.append(("extra", periods[1][0] + timedelta(seconds=170 - 0.5), "Southbound", None))
+    # Observation outside the periods
+    observations.append(("outside", start + timedelta(hours=1), "Northbound", None))
+    crossings = pl.DataFrame(crossings, schema={"ID": pl.Int64, "direction": Direction,
+                                                "crossing_time": pl.Datetime("us", "Europe/Stockholm"),
+                                                "dist_east": pl.Float64}, orient="row").sort("crossing_time")
+    observations = pl.DataFrame(observations, schema={"obs": pl.String,
+                                                      "observation_time": pl.Datetime("us", "Europe/Stockholm"),
+                                                      "direction": Direction, "relative_position": Relative_Position},
+                                orient="row").sort("observation_time")
+    return observations, crossings, periods
+
+
+class TestMatchObservations(unittest.TestCase):
+
+    def setUp(self):
+        observations, crossings, periods = _matching_fixture()
+        matches = _match_observations_graph(observations, crossings, periods)
+        # Compare the corrected observation times to the original ones
+        self.matches = matches.join(observations.select("obs", original_time="observation_time"), on="obs").select(
+            "obs", "ID", correction=(pl.col("observation_time") - pl.col("original_time")).dt.total_microseconds()
+        ).sort("obs", "ID", nulls_last=True)
+
+    def test_matched_pairs(self):
+        expected = {f"{block}-{k}": [100 * block + k] for block in range(4) for k in range(12)}
+        # The uncertain observations are matched by their relative position, but also appear unmatched
+        expected.update({"front": [50, None], "back": [51, None], "extra": [None]})
+        matches = self.matches.group_by("obs", maintain_order=True).agg("ID")
+        self.assertDictEqual(dict(zip(matches.get_column("obs"), matches.get_column("ID").to_list())), expected)
+
+    def test_corrected_times(self):
+        expected = {f"{block}-{k}": correction for block, correction in ((0, 1_230_000), (1, -800_000), (3, 2_005_555))
+                    for k in range(12)}
+        # Linear compensation
+        expected.update(zip([f"2-{k}" for k in range(12)],
+                            [156_250, 86_250, 14_500, -55_500, -125_500, -195_500, -265_500, -335_500, -405_500,
+                             -477_250, -547_250, -617_250]))
+        expected.update({"front": 1_230_000, "back": 1_230_000, "extra": 2_005_555})
+        corrections = self.matches.unique("obs", keep="first", maintain_order=True)
+        self.assertDictEqual(dict(zip(corrections.get_column("obs"), corrections.get_column("correction"))), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+
+from thesis.processing.riddarhuskajen import calculate_curvature, _observations_in_crossings
+
+
+class TestCurvature(unittest.TestCase):
+
+    def test_circle(self):
+        """
+        Points on a circle with radius r, travelled counterclockwise, have a curvature of 1/r.
+        """
+        radius = 5.0
+        angles = np.linspace(0, np.pi, 50)
+        circle = pl.DataFrame({
+            "location": "A",
+            "ID": 1,
+            "time": np.arange(len(angles)),
+            "X": radius * np.cos(angles),
+            "Y": radius * np.sin(angles)
+        })
+        curvature = calculate_curvature(circle.lazy()).collect().sort("time").get_column("curvature")
+        # The first and last two points use one-sided differences
+        np.testing.assert_allclose(curvature[2:-2].to_numpy(), 1 / radius)
+
+    def test_straight_line(self):
+        line = pl.DataFrame({
+            "location": "A",
+            "ID": 1,
+            "time": np.arange(10),
+            "X": np.arange(10) * 0.5,
+            "Y": np.arange(10) * 0.2
+        })
+        curvature = calculate_curvature(line.lazy()).collect().get_column("curvature")
+        np.testing.assert_allclose(curvature.to_numpy(), 0.0, atol=1e-12)
+
+
+class TestCrossingObservations(unittest.TestCase):
+
+    def test_back_to_back_crossings(self):
+        times = [datetime(2024, 10, 1, 7, 0, 0) + timedelta(seconds=s) for s in range(6)]
+        trajectories = pl.DataFrame({
+            "location": "A",
+            "ID": [1] * 6 + [2],
+            "time": times + [times[2]],
+            "dist": [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0]
+        })
+        # The second crossing starts at the same time the first one ends
+        crossings = pl.DataFrame({
+            "location": "A",
+            "ID": [1, 1],
+            "crossing_start": [0, 1],
+            "crossing_start_time": [times[1], times[3]],
+            "crossing_end_time": [times[3], times[4]]
+        })
+        result = (_observations_in_crossings(crossings.lazy(), trajectories.lazy())
+                  .group_by("crossing_start").agg(pl.col("dist").sum()).sort("crossing_start").collect())
+        self.assertListEqual(result.get_column("dist").to_list(), [14.0, 24.0])
+
+
+if __name__ == '__main__':
+    unittest.main()